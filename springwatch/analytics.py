@@ -0,0 +1,175 @@
+from datetime import datetime, timedelta
+from typing import Optional
+from springwatch.clock import EPOCH, from_epoch_us, to_epoch_us
+from springwatch.model import CarspecificSettings, Reading, SessionSummary, WorldView
+
+# minimum time span between two SoC readings to derive a charging rate from,
+# SoC is only reported in steps of 1/255, shorter spans give meaningless peaks
+SOC_RATE_MIN_SPAN_US = 10 * 60 * 1_000_000
+
+# SoC changes smaller than this are treated as noise when adding up the gain of a session,
+# readings jitter by a step of 1/255 and the poller accepts small changes without confirmation
+SOC_GAIN_NOISE = 1.0
+
+
+class SessionAnalytics:
+    """
+    Streaming summary of the current charging session.
+
+    update() is called once per tick and only looks at the latest readings of the WorldView,
+    so the cost per tick is constant no matter how long the session lasts.
+    SoC rates are given in percent per hour.
+    """
+
+    def __init__(self):
+        # polls can happen before update() has seen the session they belong to (the plug-in polls),
+        # they are kept apart until then
+        self._early_polls_start_us: Optional[int] = None
+        self._early_polls = 0
+        self._reset()
+
+    def _reset(self):
+        self._start_us: Optional[int] = None
+        self._last_tick_us: Optional[int] = None
+        self._was_charging = False
+        self._was_enabled = False
+        self._soc_when_us: Optional[int] = None
+        self._soc_first: Optional[float] = None
+        self._soc_last: Optional[float] = None
+        self._soc_gained = 0.0
+        self._soc_gain_ref: Optional[float] = None
+        self._soc_rate_anchor_us: Optional[int] = None
+        self._soc_rate_anchor_value = 0.0
+        self._soc_rate_peak: Optional[float] = None
+        self._charging_seconds = 0.0
+        self._enabled_not_charging_seconds = 0.0
+        self._hv_polls = 0
+        self._lv_when_us: Optional[int] = None
+        self._lv_min: Optional[float] = None
+        self._lv_parked_last: Optional[float] = None
+        self._lv_drain_parked = 0.0
+        self._energy_per_percent = 0.0
+
+    @property
+    def session_start(self) -> Optional[datetime]:
+        return from_epoch_us(self._start_us)
+
+    def record_hv_poll(self, world: WorldView) -> None:
+        start = world.session_start_us
+        if start is None:
+            return
+        if start == self._start_us:
+            self._hv_polls += 1
+            return
+        if start != self._early_polls_start_us:
+            self._early_polls_start_us = start
+            self._early_polls = 0
+        self._early_polls += 1
+
+    def update(self, world: WorldView, car: CarspecificSettings,
+               now: Optional[datetime] = None) -> Optional[SessionSummary]:
+        """Returns the summary of the previous session once it has ended."""
+        now_ts = to_epoch_us(now) if now else world.clock.now_us()
+        start = world.session_start_us
+        summary = None
+        if self._start_us is not None and start != self._start_us:
+            end = world.car_disconnected_us or now_ts
+            summary = self._summarize(end if end >= self._start_us else now_ts)
+            self._reset()
+        if start is None:
+            return summary
+        if self._start_us is None:
+            self._start_us = start
+            self._last_tick_us = now_ts
+            if self._early_polls_start_us == start:
+                self._hv_polls += self._early_polls
+            self._early_polls_start_us = None
+            self._early_polls = 0
+        self._energy_per_percent = car.battery_capacity_kwh / 100
+        self._update_durations(world.charging_enabled, world.is_charging, now_ts)
+        self._update_soc(world.battery_hv_soc_percent, start)
+        self._update_lv(world, world.battery_12v_voltage, start)
+        return summary
+
+    def _update_durations(self, enabled: bool, charging: bool, now: int):
+        # the time since the last tick is accounted to the state seen on the last tick
+        assert self._last_tick_us is not None
+        dt = max(now - self._last_tick_us, 0) / 1_000_000
+        self._last_tick_us = now
+        if self._was_charging:
+            self._charging_seconds += dt
+        elif self._was_enabled:
+            # the wakeup case: charger would deliver power, but the car does not take it
+            self._enabled_not_charging_seconds += dt
+        self._was_enabled = enabled
+        self._was_charging = charging
+
+    def _update_soc(self, r: Reading, start: int):
+        when = r.last_read_us
+        if r.value is None or when is None or when < start or when == self._soc_when_us:
+            return
+        self._soc_when_us = when
+        value = float(r.value)
+        if self._soc_first is None:
+            self._soc_first = value
+            self._soc_gain_ref = value
+        elif self._soc_gain_ref is not None:
+            # dead band around the last counted value, jitter neither adds gain nor moves the reference
+            if value >= self._soc_gain_ref + SOC_GAIN_NOISE:
+                self._soc_gained += value - self._soc_gain_ref
+                self._soc_gain_ref = value
+            elif value <= self._soc_gain_ref - SOC_GAIN_NOISE:
+                self._soc_gain_ref = value
+        self._soc_last = value
+        if self._soc_rate_anchor_us is None:
+            self._soc_rate_anchor_us = when
+            self._soc_rate_anchor_value = value
+            return
+        span = when - self._soc_rate_anchor_us
+        if span >= SOC_RATE_MIN_SPAN_US:
+            rate = (value - self._soc_rate_anchor_value) / (span / 3_600_000_000)
+            if self._soc_rate_peak is None or rate > self._soc_rate_peak:
+                self._soc_rate_peak = rate
+            self._soc_rate_anchor_us = when
+            self._soc_rate_anchor_value = value
+
+    def _update_lv(self, world: WorldView, r: Reading, start: int):
+        when = r.last_read_us
+        if r.value is None or when is None or when < start or when == self._lv_when_us:
+            return
+        self._lv_when_us = when
+        value = float(r.value)
+        if self._lv_min is None or value < self._lv_min:
+            self._lv_min = value
+        if world.is_charging or world.is_car_awake():
+            self._lv_parked_last = None
+            return
+        if self._lv_parked_last is not None and value < self._lv_parked_last:
+            self._lv_drain_parked += self._lv_parked_last - value
+        self._lv_parked_last = value
+
+    def _summarize(self, end: int) -> SessionSummary:
+        assert self._start_us is not None
+        self._update_durations(False, False, end)
+        if self._soc_last is not None and self._soc_gain_ref is not None and self._soc_last > self._soc_gain_ref:
+            # count the rest of the gain that stayed within the dead band
+            self._soc_gained += self._soc_last - self._soc_gain_ref
+            self._soc_gain_ref = self._soc_last
+        rate_avg = None
+        if self._charging_seconds > 0:
+            rate_avg = self._soc_gained / (self._charging_seconds / 3600)
+        return SessionSummary(
+            start=EPOCH + timedelta(microseconds=self._start_us),
+            end=EPOCH + timedelta(microseconds=end),
+            soc_start=self._soc_first,
+            soc_end=self._soc_last,
+            soc_gained=self._soc_gained,
+            soc_rate_avg=rate_avg,
+            soc_rate_peak=self._soc_rate_peak,
+            energy_added_kwh=self._soc_gained * self._energy_per_percent,
+            charging_seconds=self._charging_seconds,
+            enabled_not_charging_seconds=self._enabled_not_charging_seconds,
+            hv_polls=self._hv_polls,
+            lv_voltage_min=self._lv_min,
+            lv_drain_parked=self._lv_drain_parked,
+        )
@@ -0,0 +1,112 @@
+from datetime import UTC, datetime
+from springwatch.analytics import SessionAnalytics
+from springwatch.clock import VirtualClock
+from springwatch.model import CarspecificSettings, WorldView
+
+
+def end_session(world: WorldView, clock: VirtualClock):
+    world.car_connected = False
+    # wait for the session grace period to expire
+    clock.advance(10 * 60)
+
+
+def test_no_summary_without_session():
+    analytics = SessionAnalytics()
+    assert analytics.update(WorldView(), CarspecificSettings()) is None
+    assert analytics.session_start is None
+
+
+def test_summary_of_charging_session():
+    clock = VirtualClock(datetime(2025, 6, 1, 18, 0, tzinfo=UTC))
+    car = CarspecificSettings(battery_capacity_kwh=25.0)
+    world = WorldView(car_connected=True, clock=clock)
+    start = world.session_start_when
+    analytics = SessionAnalytics()
+
+    world.battery_hv_soc_percent.update(50.0)
+    world.battery_12v_voltage.update(14.2)
+    assert analytics.update(world, car) is None
+
+    clock.advance(10 * 60)
+    world.charging_enabled = True
+    analytics.record_hv_poll(world)
+    analytics.update(world, car)
+
+    clock.advance(10 * 60)
+    world.is_charging = True
+    analytics.update(world, car)
+    for soc in [55.0, 60.0, 70.0]:
+        clock.advance(20 * 60)
+        world.battery_hv_soc_percent.update(soc)
+        analytics.update(world, car)
+
+    clock.advance(10 * 60)
+    world.is_charging = False
+    world.charging_enabled = False
+    end_session(world, clock)
+    summary = analytics.update(world, car)
+    assert summary
+    assert summary.start == start
+    assert summary.end == world.car_disconnected_when
+    assert summary.soc_start == 50.0
+    assert summary.soc_end == 70.0
+    assert summary.soc_gained == 20.0
+    assert summary.energy_added_kwh == 5.0
+    assert summary.soc_rate_peak == 30.0
+    assert summary.charging_seconds == 70 * 60
+    assert summary.soc_rate_avg is not None and abs(summary.soc_rate_avg - 20.0 / (70 / 60)) < 1e-9
+    assert summary.enabled_not_charging_seconds == 10 * 60
+    assert summary.hv_polls == 1
+    assert analytics.session_start is None
+
+
+def test_polls_before_first_update_are_counted():
+    clock = VirtualClock(datetime(2025, 6, 1, 18, 0, tzinfo=UTC))
+    car = CarspecificSettings()
+    world = WorldView(clock=clock)
+    analytics = SessionAnalytics()
+    analytics.update(world, car)
+    # plug-in tick: SoC and SoH are polled before the analytics see the new session
+    world.car_connected = True
+    analytics.record_hv_poll(world)
+    world.battery_hv_soc_percent.update(50.0)
+    analytics.record_hv_poll(world)
+    world.battery_hv_soh_percent.update(96.0)
+    analytics.update(world, car)
+    clock.advance(60)
+    end_session(world, clock)
+    summary = analytics.update(world, car)
+    assert summary
+    assert summary.hv_polls == 2
+
+
+def test_soc_jitter_is_not_counted_as_gain():
+    clock = VirtualClock(datetime(2025, 6, 1, 18, 0, tzinfo=UTC))
+    car = CarspecificSettings()
+    world = WorldView(car_connected=True, clock=clock)
+    analytics = SessionAnalytics()
+    step = 100 / 255
+    for soc in [60.0, 60.0 - step, 60.0] * 10 + [62.0, 62.0 - step, 62.5]:
+        world.battery_hv_soc_percent.update(soc)
+        analytics.update(world, car)
+        clock.advance(60)
+    end_session(world, clock)
+    summary = analytics.update(world, car)
+    assert summary
+    assert abs(summary.soc_gained - 2.5) < 1e-9
+
+
+def test_lv_drain_only_counted_while_parked():
+    clock = VirtualClock(datetime(2025, 6, 1, 18, 0, tzinfo=UTC))
+    car = CarspecificSettings()
+    world = WorldView(sleep_voltage=13.0, car_connected=True, clock=clock)
+    analytics = SessionAnalytics()
+    for voltage in [14.2, 13.8, 12.6, 12.5, 12.3, 12.4]:
+        world.battery_12v_voltage.update(voltage)
+        analytics.update(world, car)
+        clock.advance(60)
+    end_session(world, clock)
+    summary = analytics.update(world, car)
+    assert summary
+    assert summary.lv_voltage_min == 12.3
+    assert abs(summary.lv_drain_parked - 0.3) < 1e-9
@@ -0,0 +1,182 @@
+from concurrent.futures import Future
+from enum import Enum
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Optional
+from springwatch.elm327 import AdapterLostError, Elm327Session
+
+CACHE_LOG = logging.getLogger("elm327.cache")
+
+SIGNAL_DEVICE_BATTERY_VOLTAGE = "12v_voltage"
+SIGNAL_HV_BATTERY_SOC = "hv_soc"
+SIGNAL_HV_BATTERY_SOH = "hv_soh"
+
+SIGNAL_READERS: dict[str, Callable[[Elm327Session], float]] = {
+    SIGNAL_DEVICE_BATTERY_VOLTAGE: lambda session: session.read_device_battery_voltage(),
+    SIGNAL_HV_BATTERY_SOC: lambda session: session.read_hv_battery_soc(),
+    SIGNAL_HV_BATTERY_SOH: lambda session: session.read_hv_battery_soh(),
+}
+
+# seconds a cached value may be served to callers that accept cached values
+DEFAULT_MAX_AGE = {
+    SIGNAL_DEVICE_BATTERY_VOLTAGE: 2.0,
+    SIGNAL_HV_BATTERY_SOC: 60.0,
+    SIGNAL_HV_BATTERY_SOH: 3600.0,
+}
+
+
+class Freshness(Enum):
+    CACHED_OK = "CACHED_OK"
+    FRESH_REQUIRED = "FRESH_REQUIRED"
+
+
+class CachingAdapter:
+    """
+    Read-through cache in front of an Elm327Session.
+
+    A single worker thread owns the session and executes queued commands one after another,
+    so any number of threads can use the adapter without racing on the socket.
+    Concurrent reads of the same signal share one in-flight query.
+
+    Values are cached as the session returns them: the HV SoC is the raw value, without the
+    SOC_PERCENT_CORRECTION applied by the poller before it is published.
+    """
+
+    def __init__(self, session: Elm327Session, max_age: Optional[dict[str, float]] = None):
+        self._session = session
+        self._max_age = dict(DEFAULT_MAX_AGE)
+        if max_age:
+            self._max_age.update(max_age)
+        self._lock = threading.Lock()
+        self._cache: dict[str, tuple[float, float]] = {}  # signal -> (value, monotonic time of read)
+        self._in_flight: dict[str, Future] = {}
+        self._queue: queue.Queue = queue.Queue()
+        self._lost: Optional[BaseException] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self) -> None:
+        assert self._thread is None
+        self._thread = threading.Thread(target=self._run, name="elm327-adapter", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._fail_pending(AdapterLostError("Adapter session closed"))
+
+    def read(self, signal: str, freshness: Freshness = Freshness.CACHED_OK) -> float:
+        return self.read_async(signal, freshness).result()
+
+    def read_async(self, signal: str, freshness: Freshness = Freshness.CACHED_OK) -> Future:
+        reader = SIGNAL_READERS[signal]
+        with self._lock:
+            if freshness == Freshness.CACHED_OK:
+                cached = self._cache.get(signal)
+                if cached is not None and time.monotonic() - cached[1] <= self._max_age[signal]:
+                    done: Future = Future()
+                    done.set_result(cached[0])
+                    return done
+            in_flight = self._in_flight.get(signal)
+            if in_flight is not None:
+                CACHE_LOG.debug("Joining in-flight read of %s", signal)
+                return in_flight
+            future = self._submit(reader, signal)
+            self._in_flight[signal] = future
+            return future
+
+    def cached_value(self, signal: str) -> Optional[tuple[float, float]]:
+        """Returns the last value and its age in seconds, without touching the adapter."""
+        with self._lock:
+            cached = self._cache.get(signal)
+        if cached is None:
+            return None
+        return cached[0], time.monotonic() - cached[1]
+
+    def execute(self, fn: Callable[[Elm327Session], Any]) -> Any:
+        """Runs an arbitrary operation with exclusive access to the adapter session."""
+        with self._lock:
+            future = self._submit(fn, None)
+        return future.result()
+
+    def _submit(self, fn: Callable[[Elm327Session], Any], signal: Optional[str]) -> Future:
+        # caller holds the lock
+        future: Future = Future()
+        if self._lost is not None:
+            future.set_exception(self._lost)
+            return future
+        self._queue.put((fn, signal, future))
+        return future
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            fn, signal, future = job
+            try:
+                value = fn(self._session)
+            except BaseException as e:
+                with self._lock:
+                    if signal is not None:
+                        self._in_flight.pop(signal, None)
+                    if isinstance(e, AdapterLostError):
+                        self._lost = e
+                future.set_exception(e)
+                if isinstance(e, AdapterLostError):
+                    self._fail_pending(e)
+                continue
+            with self._lock:
+                if signal is not None:
+                    self._in_flight.pop(signal, None)
+                    # 0.0 is what the session returns for NO DATA, don't serve that from the cache
+                    if value > 0:
+                        self._cache[signal] = (value, time.monotonic())
+            future.set_result(value)
+
+    def _fail_pending(self, e: BaseException) -> None:
+        with self._lock:
+            self._lost = self._lost or e
+            self._in_flight.clear()
+        stop_requested = False
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                stop_requested = True
+            else:
+                job[2].set_exception(e)
+        if stop_requested:
+            # stop() may have been called while we were failing the jobs, keep its request for the worker
+            self._queue.put(None)
+
+    # the poll loop needs bus values for its decisions (reading the HV battery is what wakes the car),
+    # so the reader protocols always require fresh values
+
+    def read_device_battery_voltage(self) -> float:
+        return self.read(SIGNAL_DEVICE_BATTERY_VOLTAGE, Freshness.FRESH_REQUIRED)
+
+    def read_hv_battery_soc(self) -> float:
+        return self.read(SIGNAL_HV_BATTERY_SOC, Freshness.FRESH_REQUIRED)
+
+    def read_hv_battery_soh(self) -> float:
+        return self.read(SIGNAL_HV_BATTERY_SOH, Freshness.FRESH_REQUIRED)
+
+    def idle_seconds(self) -> float:
+        return self._session.idle_seconds()
+
+    def heartbeat(self, timeout: float) -> None:
+        self.execute(lambda session: session.heartbeat(timeout))
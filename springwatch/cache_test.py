@@ -0,0 +1,120 @@
+import threading
+import pytest
+from springwatch.cache import SIGNAL_HV_BATTERY_SOC, CachingAdapter, Freshness
+from springwatch.elm327 import AdapterLostError
+
+
+class BlockingSessionMock:
+    def __init__(self, soc: float = 55.0):
+        self.soc = soc
+        self.soc_reads = 0
+        self.release = threading.Event()
+        self.release.set()
+        self.reading = threading.Event()
+        self.lost = False
+        self.owner_threads: set[str] = set()
+
+    def read_hv_battery_soc(self) -> float:
+        self.owner_threads.add(threading.current_thread().name)
+        self.soc_reads += 1
+        self.reading.set()
+        self.release.wait(5)
+        if self.lost:
+            raise AdapterLostError("gone")
+        return self.soc
+
+    def read_device_battery_voltage(self) -> float:
+        return 12.4
+
+    def read_hv_battery_soh(self) -> float:
+        return 97.0
+
+    def idle_seconds(self) -> float:
+        return 0.0
+
+
+def test_cached_value_is_served_within_max_age():
+    session = BlockingSessionMock()
+    with CachingAdapter(session) as adapter:  # type: ignore
+        assert adapter.read(SIGNAL_HV_BATTERY_SOC) == 55.0
+        session.soc = 60.0
+        assert adapter.read(SIGNAL_HV_BATTERY_SOC, Freshness.CACHED_OK) == 55.0
+        assert adapter.read(SIGNAL_HV_BATTERY_SOC, Freshness.FRESH_REQUIRED) == 60.0
+        assert session.soc_reads == 2
+
+
+def test_expired_value_is_read_again():
+    session = BlockingSessionMock()
+    with CachingAdapter(session, max_age={SIGNAL_HV_BATTERY_SOC: 0.0}) as adapter:  # type: ignore
+        adapter.read(SIGNAL_HV_BATTERY_SOC)
+        adapter.read(SIGNAL_HV_BATTERY_SOC)
+        assert session.soc_reads == 2
+
+
+def test_no_data_is_not_cached():
+    session = BlockingSessionMock(soc=0.0)
+    with CachingAdapter(session) as adapter:  # type: ignore
+        adapter.read(SIGNAL_HV_BATTERY_SOC)
+        adapter.read(SIGNAL_HV_BATTERY_SOC)
+        assert session.soc_reads == 2
+        assert adapter.cached_value(SIGNAL_HV_BATTERY_SOC) is None
+
+
+def test_concurrent_reads_share_one_query():
+    session = BlockingSessionMock()
+    session.release.clear()
+    with CachingAdapter(session) as adapter:  # type: ignore
+        first = adapter.read_async(SIGNAL_HV_BATTERY_SOC, Freshness.FRESH_REQUIRED)
+        assert session.reading.wait(5)
+        second = adapter.read_async(SIGNAL_HV_BATTERY_SOC, Freshness.FRESH_REQUIRED)
+        third = adapter.read_async(SIGNAL_HV_BATTERY_SOC, Freshness.CACHED_OK)
+        session.release.set()
+        assert first.result(5) == second.result(5) == third.result(5) == 55.0
+    assert session.soc_reads == 1
+    assert session.owner_threads == {"elm327-adapter"}
+
+
+def test_adapter_lost_fails_pending_and_later_reads():
+    session = BlockingSessionMock()
+    session.release.clear()
+    session.lost = True
+    with CachingAdapter(session) as adapter:  # type: ignore
+        first = adapter.read_async(SIGNAL_HV_BATTERY_SOC)
+        assert session.reading.wait(5)
+        queued = adapter.read_async("12v_voltage")
+        session.release.set()
+        with pytest.raises(AdapterLostError):
+            first.result(5)
+        with pytest.raises(AdapterLostError):
+            queued.result(5)
+        with pytest.raises(AdapterLostError):
+            adapter.read_hv_battery_soh()
+
+
+def test_execute_runs_on_adapter_thread():
+    with CachingAdapter(BlockingSessionMock()) as adapter:  # type: ignore
+        assert adapter.execute(lambda session: threading.current_thread().name) == "elm327-adapter"
+
+
+def test_stop_returns_when_called_while_adapter_is_lost():
+    session = BlockingSessionMock()
+    session.lost = True
+    adapter = CachingAdapter(session)  # type: ignore
+    adapter.start()
+    stopper = threading.Thread(target=adapter.stop, daemon=True)
+    stopping = threading.Event()
+
+    def stop_before_pending_reads_are_failed(future):
+        # the poll thread unwinds and stops the adapter before the worker fails the pending reads
+        stopper.start()
+        stopping.set()
+        while adapter._queue.empty():
+            stopper.join(0.001)
+
+    future = adapter.read_async(SIGNAL_HV_BATTERY_SOC)
+    future.add_done_callback(stop_before_pending_reads_are_failed)
+    assert stopping.wait(5)
+    stopper.join(5)
+    assert not stopper.is_alive()
+    with pytest.raises(AdapterLostError):
+        future.result(0)
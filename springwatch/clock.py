@@ -0,0 +1,70 @@
+from datetime import datetime, UTC, timedelta
+import time
+from typing import Optional, Protocol, Union
+
+# timestamps are kept as integer microseconds since the epoch, datetimes are only created on access
+EPOCH = datetime.fromtimestamp(0, UTC)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+
+def now_us() -> int:
+    return time.time_ns() // 1000
+
+
+def to_epoch_us(ts: datetime) -> int:
+    return (ts - EPOCH) // ONE_MICROSECOND
+
+
+def from_epoch_us(us: Optional[int]) -> Optional[datetime]:
+    return EPOCH + timedelta(microseconds=us) if us is not None else None
+
+
+class Clock(Protocol):
+    def now_us(self) -> int:
+        """Wall clock time in microseconds since the epoch."""
+        return 0
+
+    def monotonic(self) -> float:
+        return 0.0
+
+    def sleep(self, seconds: float) -> None:
+        pass
+
+
+class SystemClock:
+    def now_us(self) -> int:
+        return now_us()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+
+class VirtualClock:
+    """Clock for tests and simulations, time only moves when advanced or slept on."""
+
+    def __init__(self, start: Union[datetime, int] = 0):
+        self._now_us = to_epoch_us(start) if isinstance(start, datetime) else start
+
+    def now_us(self) -> int:
+        return self._now_us
+
+    def now(self) -> datetime:
+        ts = from_epoch_us(self._now_us)
+        assert ts
+        return ts
+
+    def monotonic(self) -> float:
+        return self._now_us / 1_000_000
+
+    def sleep(self, seconds: float) -> None:
+        self.advance(seconds)
+
+    def advance(self, seconds: float) -> None:
+        assert seconds >= 0
+        self._now_us += int(seconds * 1_000_000)
+
+
+SYSTEM_CLOCK = SystemClock()
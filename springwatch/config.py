@@ -0,0 +1,261 @@
+from datetime import timedelta
+import logging
+import os
+import signal
+from typing import Mapping, Optional
+from dotenv import dotenv_values
+from springwatch.evcc import EvccClient
+from springwatch.memory import MemoryReporter
+from springwatch.model import (CarspecificSettings, CompositeModelPublisher, ModelPublisher, PollingSettings,
+                               StdOutModelPublisher, WorldView)
+from springwatch.mqtt import MqttFormat, MqttModelPublisher
+
+CONFIG_LOG = logging.getLogger("springwatch.config")
+
+MODEL_PUBLISHERS = ["none", "stdout", "mqtt"]
+
+# settings only used on startup (adapter connection, allocation tracking, HTTP server), changing them requires a restart
+RESTART_REQUIRED = ["elm327_host", "elm327_port", "elm327_latency_model_file",
+                    "elm327_heartbeat_interval", "elm327_heartbeat_timeout", "memory_trace_frames",
+                    "http_api_bind", "http_api_port"]
+
+
+class Config:
+    def __init__(self, env: Mapping[str, str], log: bool = True):
+        self._env = env
+        self._log = log
+        self._errors: list[str] = []
+        self.elm327_host = self._get("ELM327_HOST", "127.0.0.1")
+        self.elm327_port = self._get_int("ELM327_PORT", "3333", 1, 65535)
+        self.elm327_latency_model_file = self._get("ELM327_LATENCY_MODEL_FILE", "")
+        self.elm327_heartbeat_interval = self._get_float("ELM327_HEARTBEAT_INTERVAL", "1.5", 0.1, 60.0)
+        self.elm327_heartbeat_timeout = self._get_float("ELM327_HEARTBEAT_TIMEOUT", "1.5", 0.1, 60.0)
+        self.soc_percent_correction = self._get_float("SOC_PERCENT_CORRECTION", "0.0", -20.0, 20.0)
+        self.soc_almost_full_limit = self._get_float("SOC_ALMOST_FULL_LIMIT", "99.0", 1.0, 100.0)
+        self.battery_capacity_kwh = self._get_float("BATTERY_CAPACITY_KWH", "26.8", 1.0, 500.0)
+        self.obd2_sleep_voltage = self._get_float("OBD2_SLEEP_VOLTAGE", "13.0", 1.0, 30.0)
+        self.poll_tick_seconds = self._get_float("POLL_TICK_SECONDS", "3", 0.5, 600.0)
+        self.poll_interval_wakeup = self._get_float("POLL_INTERVAL_WAKEUP_SECONDS", "60", 10.0, None)
+        self.poll_interval_wakeup_full = self._get_float("POLL_INTERVAL_WAKEUP_FULL_SECONDS", "3600", 10.0, None)
+        self.poll_interval_charging = self._get_float("POLL_INTERVAL_CHARGING_SECONDS", "120", 10.0, None)
+        self.poll_interval_awake = self._get_float("POLL_INTERVAL_AWAKE_SECONDS", "3600", 10.0, None)
+        self.poll_interval_periodic = self._get_float("POLL_INTERVAL_PERIODIC_SECONDS", "21600", 10.0, None)
+        self.model_publisher = self._get("MODEL_PUBLISHER", "none")
+        if self.model_publisher not in MODEL_PUBLISHERS:
+            self._errors.append(f"MODEL_PUBLISHER: unknown publisher {self.model_publisher}")
+        self.mqtt_broker_host = self._get("MQTT_BROKER_HOST", "127.0.0.1")
+        self.mqtt_broker_port = self._get_int("MQTT_BROKER_PORT", "1883", 1, 65535)
+        self.mqtt_base_topic = self._get("MQTT_BASE_TOPIC", f"springwatch/{self.elm327_host}")
+        self.mqtt_format = self._get("MQTT_FORMAT", "PLAIN")
+        if self.mqtt_format.upper() not in MqttFormat.__members__:
+            self._errors.append(f"MQTT_FORMAT: unknown format {self.mqtt_format}")
+        if self.model_publisher == "mqtt":
+            self._require("MQTT_BROKER_HOST", self.mqtt_broker_host)
+            self._require("MQTT_BASE_TOPIC", self.mqtt_base_topic)
+        self.evcc_url = self._get("EVCC_URL", "")
+        self.evcc_loadpoint_id = self._get_int("EVCC_LOADPOINT_ID", "1", 1, None)
+        self.memory_trace_frames = self._get_int("MEMORY_TRACE_FRAMES", "0", 0, 100)
+        self.http_api_bind = self._get("HTTP_API_BIND", "127.0.0.1")
+        self.http_api_port = self._get_int("HTTP_API_PORT", "0", 0, 65535)
+        if self._errors:
+            raise ValueError("Invalid configuration: " + "; ".join(self._errors))
+
+    def _get(self, name: str, default: str) -> str:
+        val = self._env.get(name, default)
+        if self._log:
+            CONFIG_LOG.info("%-25s = %s", name, val)
+        return val
+
+    def _require(self, name: str, value: str) -> None:
+        if not value.strip():
+            self._errors.append(f"{name}: must not be empty")
+
+    def _get_float(self, name: str, default: str, min_value: Optional[float], max_value: Optional[float]) -> float:
+        raw = self._get(name, default)
+        try:
+            val = float(raw)
+        except ValueError:
+            self._errors.append(f"{name}: not a number: {raw}")
+            return float(default)
+        if (min_value is not None and val < min_value) or (max_value is not None and val > max_value):
+            self._errors.append(f"{name}: {val} not in range [{min_value}, {max_value}]")
+        return val
+
+    def _get_int(self, name: str, default: str, min_value: Optional[int], max_value: Optional[int]) -> int:
+        raw = self._get(name, default)
+        try:
+            val = int(raw)
+        except ValueError:
+            self._errors.append(f"{name}: not an integer: {raw}")
+            return int(default)
+        if (min_value is not None and val < min_value) or (max_value is not None and val > max_value):
+            self._errors.append(f"{name}: {val} not in range [{min_value}, {max_value}]")
+        return val
+
+    def changes(self, previous: "Config") -> dict[str, tuple]:
+        """Settings that differ from the previous configuration, as name -> (previous, new)."""
+        return {name: (getattr(previous, name, None), value) for name, value in vars(self).items()
+                if not name.startswith("_") and getattr(previous, name, None) != value}
+
+    def car_settings(self) -> CarspecificSettings:
+        return CarspecificSettings(soc_percent_correction=self.soc_percent_correction,
+                                   soc_almost_full_limit=self.soc_almost_full_limit,
+                                   battery_capacity_kwh=self.battery_capacity_kwh)
+
+    def polling_settings(self) -> PollingSettings:
+        return PollingSettings(tick_seconds=self.poll_tick_seconds,
+                               wakeup_interval=timedelta(seconds=self.poll_interval_wakeup),
+                               wakeup_full_interval=timedelta(seconds=self.poll_interval_wakeup_full),
+                               charging_interval=timedelta(seconds=self.poll_interval_charging),
+                               awake_interval=timedelta(seconds=self.poll_interval_awake),
+                               periodic_interval=timedelta(seconds=self.poll_interval_periodic))
+
+    def publisher_settings(self) -> tuple:
+        return (self.model_publisher, self.mqtt_broker_host, self.mqtt_broker_port, self.mqtt_base_topic,
+                self.mqtt_format)
+
+    def create_publisher(self) -> ModelPublisher:
+        if self.model_publisher == "stdout":
+            return StdOutModelPublisher()
+        if self.model_publisher == "mqtt":
+            return MqttModelPublisher(host=self.mqtt_broker_host,
+                                      port=self.mqtt_broker_port,
+                                      base_topic=self.mqtt_base_topic,
+                                      mqtt_format=self.mqtt_format)
+        return ModelPublisher()
+
+    def evcc_settings(self) -> tuple:
+        return (self.evcc_url, self.evcc_loadpoint_id)
+
+    def create_evcc(self) -> Optional[EvccClient]:
+        return EvccClient(evcc_url=self.evcc_url, loadpoint_id=self.evcc_loadpoint_id) if self.evcc_url else None
+
+
+class ConfigReloader:
+    """
+    Re-reads the configuration when SIGHUP is received or the .env file changes.
+
+    Variables set in the process environment take precedence over the .env file, as on startup.
+    """
+
+    def __init__(self, base_env: Mapping[str, str], dotenv_path: Optional[str] = ".env"):
+        self._base_env = dict(base_env)
+        self._dotenv_path = dotenv_path
+        self._mtime = self._dotenv_mtime()
+        self._seen_mtime = self._mtime
+        self._requested = False
+
+    def install_signal_handler(self) -> None:
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self._on_signal)
+
+    def _on_signal(self, signum, frame) -> None:
+        self._requested = True
+
+    def request(self) -> None:
+        self._requested = True
+
+    def _dotenv_mtime(self) -> Optional[float]:
+        if not self._dotenv_path:
+            return None
+        try:
+            return os.stat(self._dotenv_path).st_mtime
+        except OSError:
+            return None
+
+    def env(self) -> dict[str, str]:
+        env: dict[str, str] = {}
+        if self._dotenv_path and os.path.exists(self._dotenv_path):
+            env.update({k: v for k, v in dotenv_values(self._dotenv_path).items() if v is not None})
+        env.update(self._base_env)
+        return env
+
+    def check(self) -> Optional[Config]:
+        """Returns the new configuration if a reload was requested and it is valid."""
+        mtime = self._dotenv_mtime()
+        if not self._requested and mtime == self._mtime:
+            return None
+        if mtime != self._seen_mtime:
+            # the file may be caught in the middle of being saved (truncated, not yet written),
+            # only read it once its modification time has been stable for one check
+            self._seen_mtime = mtime
+            return None
+        self._requested = False
+        self._mtime = mtime
+        CONFIG_LOG.info("Reloading configuration...")
+        try:
+            return Config(self.env(), log=False)
+        except ValueError as e:
+            CONFIG_LOG.error("%s. Keeping previous configuration.", e)
+            return None
+
+
+class Runtime:
+    """Settings and collaborators the poll loop uses, swapped in place when the configuration is reloaded."""
+
+    def __init__(self, config: Config, reloader: Optional[ConfigReloader] = None,
+                 memory: Optional[MemoryReporter] = None,
+                 state_publishers: Optional[list[ModelPublisher]] = None):
+        self.config = config
+        # cheap publishers mirroring the current state, they are kept across reloads
+        # and also updated while waiting for the adapter
+        self.state_publishers = state_publishers or []
+        self.car = config.car_settings()
+        self.polling = config.polling_settings()
+        self.publisher = self._with_state_publishers(config.create_publisher())
+        self.evcc = config.create_evcc()
+        self.reloader = reloader
+        self.memory = memory
+
+    def _with_state_publishers(self, publisher: ModelPublisher) -> ModelPublisher:
+        if not self.state_publishers:
+            return publisher
+        return CompositeModelPublisher([publisher] + self.state_publishers)
+
+    def publish_state(self, world: WorldView) -> None:
+        for publisher in self.state_publishers:
+            publisher.publish(world)
+
+    def housekeeping(self, world: WorldView) -> None:
+        """Handles pending reload and memory report requests, called from the main loop between ticks."""
+        self.reload_if_requested(world)
+        if self.memory:
+            self.memory.report_if_requested()
+
+    def reload_if_requested(self, world: WorldView) -> bool:
+        if not self.reloader:
+            return False
+        config = self.reloader.check()
+        if config is None:
+            return False
+        try:
+            self.apply(config, world)
+        except Exception as e:
+            # apply() builds everything before swapping, a failure leaves the current runtime in place
+            CONFIG_LOG.error("Failed applying configuration: %s. Keeping previous configuration.", e)
+            return False
+        return True
+
+    def apply(self, config: Config, world: WorldView) -> None:
+        changes = config.changes(self.config)
+        for name, (previous, value) in changes.items():
+            if name in RESTART_REQUIRED:
+                CONFIG_LOG.warning("%s changed from %s to %s, this only takes effect after a restart.",
+                                   name.upper(), previous, value)
+            else:
+                CONFIG_LOG.info("%s changed from %s to %s", name.upper(), previous, value)
+        if not changes:
+            CONFIG_LOG.info("Configuration unchanged.")
+        # build everything first, so a failure leaves the current runtime untouched
+        car = config.car_settings()
+        polling = config.polling_settings()
+        publisher = self.publisher
+        if config.publisher_settings() != self.config.publisher_settings():
+            publisher = self._with_state_publishers(config.create_publisher())
+        evcc = self.evcc
+        if config.evcc_settings() != self.config.evcc_settings():
+            evcc = config.create_evcc()
+        self.car, self.polling, self.publisher, self.evcc = car, polling, publisher, evcc
+        world.sleep_voltage = config.obd2_sleep_voltage
+        self.config = config
+        CONFIG_LOG.info("Configuration reloaded.")
@@ -0,0 +1,124 @@
+import os
+import pytest
+from springwatch.config import Config, ConfigReloader, Runtime
+from springwatch.model import StdOutModelPublisher, WorldView
+
+
+def test_defaults():
+    config = Config({}, log=False)
+    assert config.elm327_port == 3333
+    assert config.mqtt_base_topic == "springwatch/127.0.0.1"
+    assert config.polling_settings().tick_seconds == 3.0
+    assert config.create_evcc() is None
+
+
+def test_invalid_values_are_rejected():
+    with pytest.raises(ValueError) as e:
+        Config({"SOC_ALMOST_FULL_LIMIT": "abc", "MODEL_PUBLISHER": "carrier-pigeon", "ELM327_PORT": "0"}, log=False)
+    assert "SOC_ALMOST_FULL_LIMIT" in str(e.value)
+    assert "MODEL_PUBLISHER" in str(e.value)
+    assert "ELM327_PORT" in str(e.value)
+
+
+def test_reload_on_file_change(tmp_path):
+    path = tmp_path / ".env"
+    path.write_text("SOC_PERCENT_CORRECTION=1.0\n")
+    reloader = ConfigReloader(base_env={}, dotenv_path=str(path))
+    assert reloader.check() is None
+    path.write_text("SOC_PERCENT_CORRECTION=2.5\n")
+    os.utime(path, (0, 12345))
+    # reloaded once the file has been stable for one check
+    assert reloader.check() is None
+    config = reloader.check()
+    assert config and config.soc_percent_correction == 2.5
+    assert reloader.check() is None
+
+
+def test_file_caught_mid_save_is_not_loaded(tmp_path):
+    path = tmp_path / ".env"
+    path.write_text("SOC_PERCENT_CORRECTION=1.0\n")
+    reloader = ConfigReloader(base_env={}, dotenv_path=str(path))
+    path.write_text("")
+    os.utime(path, (0, 12345))
+    assert reloader.check() is None
+    path.write_text("SOC_PERCENT_CORRECTION=2.5\n")
+    os.utime(path, (0, 12346))
+    assert reloader.check() is None
+    config = reloader.check()
+    assert config and config.soc_percent_correction == 2.5
+
+
+def test_changes_are_listed():
+    previous = Config({"SOC_PERCENT_CORRECTION": "1.0"}, log=False)
+    config = Config({"SOC_PERCENT_CORRECTION": "2.5", "ELM327_PORT": "35000"}, log=False)
+    assert config.changes(previous) == {"soc_percent_correction": (1.0, 2.5), "elm327_port": (3333, 35000)}
+    assert config.changes(config) == {}
+
+
+def test_process_environment_takes_precedence(tmp_path):
+    path = tmp_path / ".env"
+    path.write_text("SOC_PERCENT_CORRECTION=1.0\nOBD2_SLEEP_VOLTAGE=12.5\n")
+    reloader = ConfigReloader(base_env={"SOC_PERCENT_CORRECTION": "3.0"}, dotenv_path=str(path))
+    reloader.request()
+    config = reloader.check()
+    assert config
+    assert config.soc_percent_correction == 3.0
+    assert config.obd2_sleep_voltage == 12.5
+
+
+def test_invalid_reload_keeps_previous_configuration(tmp_path):
+    path = tmp_path / ".env"
+    path.write_text("SOC_PERCENT_CORRECTION=1.0\n")
+    reloader = ConfigReloader(base_env={}, dotenv_path=str(path))
+    world = WorldView()
+    runtime = Runtime(Config(reloader.env(), log=False), reloader=reloader)
+    path.write_text("SOC_PERCENT_CORRECTION=100\n")
+    reloader.request()
+    assert not runtime.reload_if_requested(world)
+    assert runtime.car.soc_percent_correction == 1.0
+
+
+def test_empty_mqtt_settings_are_rejected():
+    with pytest.raises(ValueError) as e:
+        Config({"MODEL_PUBLISHER": "mqtt", "MQTT_BASE_TOPIC": "", "MQTT_BROKER_HOST": " "}, log=False)
+    assert "MQTT_BASE_TOPIC" in str(e.value)
+    assert "MQTT_BROKER_HOST" in str(e.value)
+    assert Config({"MODEL_PUBLISHER": "none", "MQTT_BASE_TOPIC": ""}, log=False)
+
+
+def test_failing_reload_keeps_previous_runtime(tmp_path, monkeypatch, caplog):
+    path = tmp_path / ".env"
+    path.write_text("SOC_PERCENT_CORRECTION=1.0\n")
+    reloader = ConfigReloader(base_env={}, dotenv_path=str(path))
+    world = WorldView()
+    runtime = Runtime(Config(reloader.env(), log=False), reloader=reloader)
+    publisher = runtime.publisher
+
+    def broken_publisher(self):
+        raise AssertionError("cannot create publisher")
+
+    monkeypatch.setattr(Config, "create_publisher", broken_publisher)
+    path.write_text("SOC_PERCENT_CORRECTION=2.0\nMODEL_PUBLISHER=stdout\n")
+    os.utime(path, (0, 12345))
+    with caplog.at_level("ERROR", logger="springwatch.config"):
+        # the first check only notices the change, the second one applies it
+        assert not runtime.reload_if_requested(world)
+        assert not runtime.reload_if_requested(world)
+    assert "Failed applying configuration" in caplog.text
+    assert runtime.publisher is publisher
+    assert runtime.car.soc_percent_correction == 1.0
+
+
+def test_apply_swaps_settings_and_keeps_unchanged_publisher():
+    world = WorldView(sleep_voltage=13.0)
+    runtime = Runtime(Config({"MODEL_PUBLISHER": "stdout"}, log=False))
+    publisher = runtime.publisher
+    assert isinstance(publisher, StdOutModelPublisher)
+    runtime.apply(Config({"MODEL_PUBLISHER": "stdout", "SOC_ALMOST_FULL_LIMIT": "95",
+                          "OBD2_SLEEP_VOLTAGE": "12.8", "POLL_TICK_SECONDS": "5"}, log=False), world)
+    assert runtime.publisher is publisher
+    assert runtime.car.soc_almost_full_limit == 95.0
+    assert runtime.polling.tick_seconds == 5.0
+    assert world.sleep_voltage == 12.8
+    runtime.apply(Config({"MODEL_PUBLISHER": "none"}, log=False), world)
+    assert runtime.publisher is not publisher
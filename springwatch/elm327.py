@@ -1,20 +1,64 @@
 import logging
 import socket
+import time
 from typing import Optional, Protocol
 
+from springwatch.latency import ATST_HYSTERESIS, REQUEST_CLASS_ADAPTER, LatencyModel, request_class
+
 
 COMM_LOG = logging.getLogger("elm327.comm")
 SESSION_LOG = logging.getLogger("elm327.session")
 CON_LOG = logging.getLogger("elm327.con")
 
+# how long to wait for the rest of a reply that missed its deadline before sending the next command
+LATE_REPLY_FLUSH_SECONDS = 0.2
+
+
+class AdapterLostError(ConnectionError):
+    """The adapter stopped responding or the connection to it broke, a reconnect is required."""
+    pass
+
+
+class ConnectionHealthSettings:
+    def __init__(self,
+                 heartbeat_interval: float = 1.5,
+                 # not below the shortest read deadline (LatencyModel.min_timeout), a WiFi hiccup is no lost adapter
+                 heartbeat_timeout: float = 1.5,
+                 keepalive_idle: int = 5,
+                 keepalive_interval: int = 2,
+                 keepalive_count: int = 3):
+        assert heartbeat_interval > 0 and heartbeat_timeout > 0
+        assert keepalive_idle > 0 and keepalive_interval > 0 and keepalive_count > 0
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.keepalive_idle = keepalive_idle
+        self.keepalive_interval = keepalive_interval
+        self.keepalive_count = keepalive_count
+
+    @property
+    def keepalive_timeout(self) -> int:
+        """Seconds until the kernel gives up on an unresponsive peer."""
+        return self.keepalive_idle + self.keepalive_interval * self.keepalive_count
+
+    @property
+    def detection_timeout(self) -> float:
+        """Upper bound for noticing a dead adapter while idling between polls."""
+        return self.heartbeat_interval + self.heartbeat_timeout
+
 
 class Elm327Communicator:
-    def __init__(self, socket: socket.socket):
+    def __init__(self, socket: socket.socket, latency: Optional[LatencyModel] = None):
         assert socket
         self._socket = socket
+        self._latency = latency if latency is not None else LatencyModel()
+        self._late_reply = False
+        self.last_activity = time.monotonic()
 
-    def send_cmd_get_first_line(self, cmd: bytes) -> bytes:
-        response = self.send_cmd_and_read_until(cmd, b'>')
+    def idle_seconds(self) -> float:
+        return time.monotonic() - self.last_activity
+
+    def send_cmd_get_first_line(self, cmd: bytes, timeout: Optional[float] = None) -> bytes:
+        response = self.send_cmd_and_read_until(cmd, b'>', timeout)
         idx = response.find(b'\r')
         first_line = b""
         if idx >= 0:
@@ -34,20 +78,76 @@ class Elm327Communicator:
         COMM_LOG.info("response=%s, expected=%s, equal=%s", first_line, expected, first_line == expected)
         return first_line == expected, first_line
 
-    def send_cmd_and_read_until(self, cmd: bytes, terminator=b'>') -> bytes:
+    def send_cmd_and_read_until(self, cmd: bytes, terminator=b'>', timeout: Optional[float] = None) -> bytes:
+        if timeout is None:
+            timeout = self._latency.read_timeout(cmd)
+        if self._late_reply:
+            self._discard_late_reply()
         self.send_cmd(cmd)
-        data = b""
+        started = time.monotonic()
+        deadline = started + timeout
+        data = bytearray()
+        trace = COMM_LOG.isEnabledFor(logging.DEBUG)
         while len(data) == 0 or data[-1] != terminator[0]:
-            ch = self._socket.recv(1)
+            ch: Optional[bytes] = None
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                self._socket.settimeout(remaining)
+                try:
+                    ch = self._socket.recv(1)
+                except TimeoutError:
+                    pass
+                except OSError as e:
+                    raise AdapterLostError(f"Receiving response to {cmd!r} failed: {e}") from e
+            if ch is None:
+                self._latency.observe_timeout(cmd, timeout)
+                self._late_reply = True
+                if request_class(cmd) == REQUEST_CLASS_ADAPTER:
+                    # the adapter answers these itself, silence means the connection is gone (half-open)
+                    raise AdapterLostError(f"No response to {cmd!r} within {timeout:.2f}s")
+                raise TimeoutError(f"No response to {cmd!r} within {timeout:.2f}s")
+            if not ch:
+                raise AdapterLostError(f"Adapter closed the connection while waiting for response to {cmd!r}")
             data += ch
-            COMM_LOG.debug(" << %s (%s): %s", ch, ord(ch), data)
-        COMM_LOG.info("RX: %s", data)
-        return data
+            if trace:
+                COMM_LOG.debug(" << %s (%s): %s", ch, ord(ch), data)
+        self.last_activity = time.monotonic()
+        self._latency.observe(cmd, self.last_activity - started)
+        response = bytes(data)
+        COMM_LOG.info("RX: %s", response)
+        return response
+
+    def _discard_late_reply(self):
+        # the reply to a command that missed its deadline may still arrive,
+        # it must not be taken for the reply to the next command
+        self._late_reply = False
+        deadline = time.monotonic() + LATE_REPLY_FLUSH_SECONDS
+        discarded = bytearray()
+        while not discarded.endswith(b">"):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._socket.settimeout(remaining)
+            try:
+                ch = self._socket.recv(64)
+            except TimeoutError:
+                break
+            except OSError as e:
+                raise AdapterLostError(f"Receiving late reply failed: {e}") from e
+            if not ch:
+                raise AdapterLostError("Adapter closed the connection")
+            discarded += ch
+        if discarded:
+            COMM_LOG.info("Discarded late reply: %s", bytes(discarded))
 
     def send_cmd(self, cmd: bytes):
         COMM_LOG.info("TX: %s", cmd)
-        self._socket.send(cmd)
-        self._socket.send(b"\r")
+        try:
+            # single write per command, so a command is never split across segments
+            self._socket.sendall(cmd + b"\r")
+        except OSError as e:
+            # includes a send timeout: the send buffer stays full when the peer is gone (half-open)
+            raise AdapterLostError(f"Sending {cmd!r} failed: {e}") from e
 
 
 class ReadsDeviceBatteryVoltage(Protocol):
@@ -77,10 +177,12 @@ class Elm327Session:
         b"ATSP7",    # 7 - ISO 15765-4 CAN (29 bit ID, 500Kbaud)
     ]
 
-    def __init__(self, socket: socket.socket):
+    def __init__(self, socket: socket.socket, latency: Optional[LatencyModel] = None):
         assert socket
         self._socket = socket
-        self._comm = Elm327Communicator(socket)
+        self._latency = latency if latency is not None else LatencyModel()
+        self._comm = Elm327Communicator(socket, self._latency)
+        self._response_timeout: Optional[int] = None
 
     def __enter__(self):
         self.initialize_or_reset()
@@ -92,6 +194,7 @@ class Elm327Session:
 
     def initialize_or_reset(self):
         SESSION_LOG.info("Resetting and reinitializing ELM327...")
+        self._response_timeout = None  # ATZ restores the adapter default
         try:
             self._comm.send_cmd_and_read_until(b"ATZ", b">")
             # send twice, if previous session was stuck in a strange state,
@@ -107,6 +210,36 @@ class Elm327Session:
                 SESSION_LOG.warning("INIT ERROR: %s not acknowledged: %s", cmd, first_line)
         SESSION_LOG.info("Initialization of adapter done.")
 
+    def idle_seconds(self) -> float:
+        return self._comm.idle_seconds()
+
+    def heartbeat(self, timeout: float) -> None:
+        """Cheap adapter-local round trip (no bus traffic), raises AdapterLostError if there is no answer."""
+        self._comm.send_cmd_get_first_line(b"ATI", timeout)
+
+    def _apply_response_timeout(self, cmd: bytes):
+        value = self._latency.response_timeout(cmd)
+        if value is None:
+            return
+        if self._response_timeout is not None and abs(value - self._response_timeout) < ATST_HYSTERESIS:
+            return
+        atst = b"ATST%02X" % value
+        ok, first_line = self._comm.send_cmd_and_expect(atst, b"OK")
+        if ok:
+            SESSION_LOG.debug("Response timeout for %s set to %sms", cmd, value * 4)
+            self._response_timeout = value
+        else:
+            SESSION_LOG.warning("%s not acknowledged: %s", atst, first_line)
+
+    def _query_ecu(self, cmd: bytes) -> bytes:
+        self._apply_response_timeout(cmd)
+        try:
+            return self._comm.send_cmd_get_first_line(cmd)
+        except TimeoutError as e:
+            # a slow ECU reply does not end the session, it is handled like a missing value for this tick
+            SESSION_LOG.warning("%s", e)
+            return b"NO DATA"
+
     def read_device_battery_voltage(self) -> float:
         v = self._comm.send_cmd_get_first_line(b"ATRV")
         if len(v) == 0:
@@ -116,7 +249,7 @@ class Elm327Session:
         return float(v)
 
     def read_hv_battery_soc(self) -> float:
-        res = self._comm.send_cmd_get_first_line(b"015B")
+        res = self._query_ecu(b"015B")
         if res == b'NO DATA':
             SESSION_LOG.warning("Querying HV battery SoC: NO DATA")
             return 0.0
@@ -128,7 +261,7 @@ class Elm327Session:
         return float(value_byte) * 100 / 255
 
     def read_hv_battery_soh(self) -> float:
-        res = self._comm.send_cmd_get_first_line(b"01B2")
+        res = self._query_ecu(b"01B2")
         if res == b'NO DATA':
             SESSION_LOG.warning("Querying HV battery SoH: NO DATA")
             return 0.0
@@ -140,10 +273,13 @@ class Elm327Session:
 
 
 class Elm327Connection:
-    def __init__(self, host: str, port: int, timeout=3):
+    def __init__(self, host: str, port: int, timeout=3, latency: Optional[LatencyModel] = None,
+                 health: Optional[ConnectionHealthSettings] = None):
         self.host = host
         self.port = port
         self.timeout = timeout
+        self.health = health if health is not None else ConnectionHealthSettings()
+        self.latency = latency if latency is not None else LatencyModel(default_timeout=timeout)
         self._connected = False
         self._socket: Optional[socket.socket] = None
         self._connection_exception_logged = False
@@ -161,34 +297,56 @@ class Elm327Connection:
     def connect(self) -> bool:
         self.close()
         try:
-            CON_LOG.debug(f"Connecting to {self.host}:{self.port}...")
+            CON_LOG.debug("Connecting to %s:%s...", self.host, self.port)
             self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self._socket.settimeout(self.timeout)
+            self._configure_socket(self._socket)
             self._socket.connect((self.host, self.port))
             self._connected = True
             self._connection_exception_logged = False
-            CON_LOG.info(f"Connected to {self.host}:{self.port}")
+            CON_LOG.info("Connected to %s:%s", self.host, self.port)
         except socket.timeout:
-            CON_LOG.debug(f"Timeout occurred. Unable to connect within {self.timeout} seconds.")
+            CON_LOG.debug("Timeout occurred. Unable to connect within %s seconds.", self.timeout)
         except ConnectionRefusedError:
             level = logging.WARNING if not self._connection_exception_logged else logging.DEBUG
             CON_LOG.log(level, "The server is not accepting connections from this host or port.")
             self._connection_exception_logged = True
         except Exception as e:
             level = logging.WARNING if not self._connection_exception_logged else logging.DEBUG
-            CON_LOG.log(level, f"An error occurred: {str(e)}")
+            CON_LOG.log(level, "An error occurred: %s", e)
             self._connection_exception_logged = True
         return self._connected
 
+    def _configure_socket(self, sock: socket.socket) -> None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # keepalive tuning is platform specific, apply what is available
+        options = [
+            ("TCP_KEEPIDLE", self.health.keepalive_idle),
+            ("TCP_KEEPALIVE", self.health.keepalive_idle),  # macOS name of TCP_KEEPIDLE
+            ("TCP_KEEPINTVL", self.health.keepalive_interval),
+            ("TCP_KEEPCNT", self.health.keepalive_count),
+            # abort if sent data stays unacknowledged, keepalive alone does not cover this
+            ("TCP_USER_TIMEOUT", self.health.keepalive_timeout * 1000),
+        ]
+        for name, value in options:
+            opt = getattr(socket, name, None)
+            if opt is None:
+                continue
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, opt, value)
+            except OSError as e:
+                CON_LOG.debug("Unable to set %s: %s", name, e)
+
     def close(self) -> None:
         self._connected = False
         try:
             if self._socket:
                 self._socket.close()
                 if self._connected:
-                    CON_LOG.info(f"Disconnected from {self.host}:{self.port}")
+                    CON_LOG.info("Disconnected from %s:%s", self.host, self.port)
         except Exception as e:
-            CON_LOG.warning(f"Failed closing previous socket: {e}")
+            CON_LOG.warning("Failed closing previous socket: %s", e)
         finally:
             self._socket = None
             self._connected = False
@@ -196,4 +354,4 @@ class Elm327Connection:
     def new_session(self):
         if not self._connected or not self._socket:
             raise Exception("Not connected")
-        return Elm327Session(self._socket)
+        return Elm327Session(self._socket, self.latency)
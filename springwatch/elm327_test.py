@@ -0,0 +1,90 @@
+import pytest
+from springwatch.elm327 import AdapterLostError, ConnectionHealthSettings, Elm327Communicator, Elm327Session
+from springwatch.latency import LatencyModel
+
+
+class ClosedSocketMock:
+    def settimeout(self, timeout: float):
+        pass
+
+    def sendall(self, data: bytes):
+        pass
+
+    def recv(self, size: int) -> bytes:
+        return b""
+
+
+class SilentSocketMock(ClosedSocketMock):
+    def recv(self, size: int) -> bytes:
+        raise TimeoutError("timed out")
+
+
+class BrokenPipeSocketMock(ClosedSocketMock):
+    def sendall(self, data: bytes):
+        raise BrokenPipeError("Broken pipe")
+
+
+class FullSendBufferSocketMock(ClosedSocketMock):
+    def sendall(self, data: bytes):
+        raise TimeoutError("timed out")
+
+
+class RecordingSocketMock(ClosedSocketMock):
+    def __init__(self):
+        self.writes: list[bytes] = []
+        self._pending = b""
+
+    def sendall(self, data: bytes):
+        self.writes.append(data)
+        self._pending += b"OK\r\r>"
+
+    def recv(self, size: int) -> bytes:
+        ch = self._pending[:size]
+        self._pending = self._pending[size:]
+        return ch
+
+
+def test_command_is_sent_in_a_single_write():
+    sock = RecordingSocketMock()
+    Elm327Communicator(sock, LatencyModel()).send_cmd_and_expect(b"ATE0")  # type: ignore
+    assert sock.writes == [b"ATE0\r"]
+
+
+def test_closed_connection_is_adapter_lost():
+    comm = Elm327Communicator(ClosedSocketMock(), LatencyModel())  # type: ignore
+    with pytest.raises(AdapterLostError):
+        comm.send_cmd_get_first_line(b"ATRV")
+
+
+def test_failed_send_is_adapter_lost():
+    comm = Elm327Communicator(BrokenPipeSocketMock(), LatencyModel())  # type: ignore
+    with pytest.raises(AdapterLostError):
+        comm.send_cmd_get_first_line(b"ATRV")
+
+
+def test_missing_heartbeat_is_adapter_lost():
+    session = Elm327Session(SilentSocketMock(), LatencyModel())  # type: ignore
+    with pytest.raises(AdapterLostError):
+        session.heartbeat(0.01)
+
+
+def test_silent_adapter_on_poll_command_is_adapter_lost():
+    session = Elm327Session(SilentSocketMock(), LatencyModel())  # type: ignore
+    with pytest.raises(AdapterLostError):
+        session.read_device_battery_voltage()
+
+
+def test_silent_ecu_is_a_timeout():
+    comm = Elm327Communicator(SilentSocketMock(), LatencyModel())  # type: ignore
+    with pytest.raises(TimeoutError):
+        comm.send_cmd_get_first_line(b"015B")
+
+
+def test_blocked_send_is_adapter_lost():
+    comm = Elm327Communicator(FullSendBufferSocketMock(), LatencyModel())  # type: ignore
+    with pytest.raises(AdapterLostError):
+        comm.send_cmd_get_first_line(b"015B")
+
+
+def test_heartbeat_tolerates_what_a_read_deadline_tolerates():
+    assert ConnectionHealthSettings().heartbeat_timeout >= LatencyModel().min_timeout
@@ -0,0 +1,158 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import secrets
+import threading
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+from springwatch.clock import from_epoch_us
+from springwatch.model import ModelPublisher, Reading, WorldView
+
+HTTP_LOG = logging.getLogger("springwatch.http")
+
+MAX_LONG_POLL_SECONDS = 60.0
+
+
+def _iso(us: Optional[int]) -> Optional[str]:
+    ts = from_epoch_us(us)
+    return ts.isoformat() if ts else None
+
+
+def _reading_state(reading: Reading, now: int) -> dict:
+    us = reading.last_read_us
+    return {
+        "value": reading.value,
+        "when": _iso(us),
+        "age_s": round((now - us) / 1_000_000, 1) if us is not None else None,
+    }
+
+
+class StateStore:
+    """
+    JSON snapshot of the WorldView, served to HTTP clients without touching the adapter.
+
+    The version only changes when values or states change, not when a reading is merely refreshed.
+    The ETag is therefore weak: reading timestamps and ages in the body may differ for the same ETag.
+    It is prefixed with a per-process token, so an ETag from before a restart never matches.
+    """
+
+    def __init__(self):
+        self._instance = secrets.token_hex(4)
+        self._cond = threading.Condition()
+        self._version = 0
+        self._key: Optional[tuple] = None
+        self._body: Optional[bytes] = None
+
+    def update(self, world: WorldView) -> None:
+        now = world.clock.now_us()
+        soc, soh, v12 = world.battery_hv_soc_percent, world.battery_hv_soh_percent, world.battery_12v_voltage
+        key = (soc.value, soh.value, v12.value, world.car_connected, bool(world.is_car_awake()),
+               world.session_start_us, world.charging_enabled, world.is_charging)
+        state = {
+            "soc": soc.value,
+            "soh": soh.value,
+            "voltage_12v": v12.value,
+            "car_connected": world.car_connected,
+            "car_awake": bool(world.is_car_awake()),
+            "session_active": world.session_start_us is not None,
+            "session_start": _iso(world.session_start_us),
+            "charging_enabled": world.charging_enabled,
+            "is_charging": world.is_charging,
+            "readings": {r.short_name: _reading_state(r, now) for r in world.readings},
+            "as_of": _iso(now),
+        }
+        body = json.dumps(state).encode("utf-8")
+        with self._cond:
+            self._body = body
+            if key != self._key:
+                self._key = key
+                self._version += 1
+                self._cond.notify_all()
+
+    def _etag(self) -> str:
+        return f'W/"{self._instance}-{self._version}"'
+
+    def snapshot(self) -> tuple[str, Optional[bytes]]:
+        with self._cond:
+            return self._etag(), self._body
+
+    def wait_for_change(self, etag: str, timeout: float) -> tuple[str, Optional[bytes]]:
+        with self._cond:
+            self._cond.wait_for(lambda: self._etag() != etag, timeout)
+            return self._etag(), self._body
+
+
+class HttpStatePublisher(ModelPublisher):
+    def __init__(self, store: StateStore):
+        ModelPublisher.__init__(self)
+        self.store = store
+
+    def publish(self, world: WorldView) -> None:
+        self.store.update(world)
+
+
+class StateRequestHandler(BaseHTTPRequestHandler):
+    server: "HttpStateServer"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path not in ("/", "/state"):
+            self._send(404, b'{"error": "not found"}')
+            return
+        store = self.server.store
+        etag, body = store.snapshot()
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match and if_none_match == etag:
+            wait = self._wait_seconds(url.query)
+            if wait > 0:
+                etag, body = store.wait_for_change(etag, wait)
+            if etag == if_none_match:
+                self._send(304, None, etag)
+                return
+        if body is None:
+            self._send(503, b'{"error": "no state yet"}')
+            return
+        self._send(200, body, etag)
+
+    def _wait_seconds(self, query: str) -> float:
+        try:
+            wait = float(parse_qs(query).get("wait", ["0"])[0])
+        except ValueError:
+            return 0.0
+        return min(max(wait, 0.0), MAX_LONG_POLL_SECONDS)
+
+    def _send(self, status: int, body: Optional[bytes], etag: Optional[str] = None):
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body is not None:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        HTTP_LOG.debug("%s - " + format, self.address_string(), *args)
+
+
+class HttpStateServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, store: StateStore, host: str = "127.0.0.1", port: int = 8327):
+        super().__init__((host, port), StateRequestHandler)
+        self.store = store
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self.serve_forever, name="http-state", daemon=True)
+        self._thread.start()
+        HTTP_LOG.info("Serving state on http://%s:%s/state", *self.server_address[:2])
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,92 @@
+import json
+import threading
+import time
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+import pytest
+from springwatch.http_api import HttpStatePublisher, HttpStateServer, StateStore
+from springwatch.model import WorldView
+
+
+@pytest.fixture
+def server():
+    server = HttpStateServer(StateStore(), port=0)
+    server.start()
+    yield server
+    server.stop()
+
+
+def get(server: HttpStateServer, path: str = "/state", etag=None):
+    host, port = server.server_address[:2]
+    headers = {"If-None-Match": etag} if etag else {}
+    try:
+        with urlopen(Request(f"http://{host}:{port}{path}", headers=headers), timeout=5) as response:
+            return response.status, response.headers.get("ETag"), json.loads(response.read())
+    except HTTPError as e:
+        return e.code, e.headers.get("ETag"), None
+
+
+def test_no_state_yet(server):
+    status, _, _ = get(server)
+    assert status == 503
+
+
+def test_serves_snapshot_and_etag(server):
+    world = WorldView(car_connected=True)
+    world.battery_hv_soc_percent.update(55.3)
+    HttpStatePublisher(server.store).publish(world)
+    status, etag, state = get(server)
+    assert status == 200
+    assert state["soc"] == 55.3
+    assert state["session_active"]
+    assert state["readings"]["hv_soc"]["age_s"] >= 0
+    assert get(server, etag=etag)[0] == 304
+    assert get(server, "/other")[0] == 404
+
+
+def test_refreshed_reading_keeps_etag():
+    store = StateStore()
+    world = WorldView(car_connected=True)
+    world.battery_12v_voltage.update(12.6)
+    store.update(world)
+    etag, _ = store.snapshot()
+    world.battery_12v_voltage.update(12.6)
+    store.update(world)
+    assert store.snapshot()[0] == etag
+    world.battery_12v_voltage.update(12.5)
+    store.update(world)
+    assert store.snapshot()[0] != etag
+
+
+def test_etag_differs_after_restart():
+    world = WorldView(car_connected=True)
+    world.battery_12v_voltage.update(12.6)
+    before, restarted = StateStore(), StateStore()
+    before.update(world)
+    restarted.update(world)
+    assert before.snapshot()[0] != restarted.snapshot()[0]
+
+
+def test_long_poll_returns_on_change(server):
+    world = WorldView(car_connected=True)
+    publisher = HttpStatePublisher(server.store)
+    publisher.publish(world)
+    _, etag, _ = get(server)
+
+    def change():
+        time.sleep(0.2)
+        world.battery_hv_soc_percent.update(60.0)
+        publisher.publish(world)
+    threading.Thread(target=change).start()
+    started = time.monotonic()
+    status, new_etag, state = get(server, "/state?wait=5", etag=etag)
+    assert status == 200
+    assert new_etag != etag
+    assert state["soc"] == 60.0
+    assert time.monotonic() - started < 4
+
+
+def test_long_poll_times_out_with_not_modified(server):
+    HttpStatePublisher(server.store).publish(WorldView())
+    _, etag, _ = get(server)
+    assert get(server, "/state?wait=0.2", etag=etag)[0] == 304
@@ -0,0 +1,203 @@
+import json
+import logging
+import math
+import os
+import time
+from typing import Optional
+
+LATENCY_LOG = logging.getLogger("elm327.latency")
+
+# log-spaced histogram buckets from 5ms to ~30s, each bucket 25% wider than the previous one
+BUCKET_BASE = 0.005
+BUCKET_GROWTH = 1.25
+BUCKET_COUNT = 40
+
+# ELM327 ATST unit is 4ms, 0x32 (200ms) is the adapter default after reset
+ATST_UNIT = 0.004
+ATST_DEFAULT = 0x32
+ATST_MAX = 0xFF
+ATST_HYSTERESIS = 0x08
+
+REQUEST_CLASS_RESET = "reset"
+REQUEST_CLASS_ADAPTER = "adapter"
+REQUEST_CLASS_ECU = "ecu"
+
+RESET_COMMANDS = (b"ATZ", b"ATWS", b"ATD")
+
+
+def request_class(cmd: bytes) -> str:
+    if cmd in RESET_COMMANDS:
+        return REQUEST_CLASS_RESET
+    if cmd[:2] == b"AT":
+        return REQUEST_CLASS_ADAPTER
+    return REQUEST_CLASS_ECU
+
+
+class LatencyHistogram:
+    """
+    Streaming latency distribution with exponential forgetting.
+
+    Each observation is O(1): instead of decaying all buckets, the weight of new samples grows
+    and the buckets are renormalized once the weight gets large.
+    """
+
+    def __init__(self, decay: float = 0.99, counts: Optional[list[float]] = None, samples: int = 0):
+        assert 0.0 < decay <= 1.0
+        self.decay = decay
+        self.counts = list(counts) if counts else [0.0] * BUCKET_COUNT
+        assert len(self.counts) == BUCKET_COUNT
+        self.total = sum(self.counts)
+        self.samples = samples
+        self._weight = 1.0
+
+    @staticmethod
+    def bucket_of(seconds: float) -> int:
+        if seconds <= BUCKET_BASE:
+            return 0
+        idx = int(math.log(seconds / BUCKET_BASE) / math.log(BUCKET_GROWTH)) + 1
+        return min(idx, BUCKET_COUNT - 1)
+
+    @staticmethod
+    def upper_bound(idx: int) -> float:
+        return BUCKET_BASE * BUCKET_GROWTH ** idx
+
+    def observe(self, seconds: float) -> None:
+        self.counts[self.bucket_of(seconds)] += self._weight
+        self.total += self._weight
+        self.samples += 1
+        self._weight /= self.decay
+        if self._weight > 1e6:
+            self._normalize()
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.total <= 0:
+            return None
+        target = q * self.total
+        acc = 0.0
+        for idx, count in enumerate(self.counts):
+            acc += count
+            if acc >= target:
+                return self.upper_bound(idx)
+        return self.upper_bound(BUCKET_COUNT - 1)
+
+    def _normalize(self) -> None:
+        w = self._weight
+        self.counts = [c / w for c in self.counts]
+        self.total /= w
+        self._weight = 1.0
+
+    def to_dict(self) -> dict:
+        self._normalize()
+        return {"counts": [round(c, 6) for c in self.counts], "samples": self.samples}
+
+    @classmethod
+    def from_dict(cls, data: dict, decay: float = 0.99) -> "LatencyHistogram":
+        return cls(decay=decay, counts=data["counts"], samples=int(data.get("samples", 0)))
+
+
+class LatencyModel:
+    """
+    Learns per-command response latencies of the adapter and derives read deadlines
+    and the ELM327 response timeout (ATST) from them.
+    """
+
+    DEADLINE_QUANTILE = 0.99
+    DEADLINE_FACTOR = 1.5
+    DEADLINE_MARGIN = 0.2
+    MIN_SAMPLES = 20
+
+    def __init__(self,
+                 path: Optional[str] = None,
+                 default_timeout: float = 3.0,
+                 reset_timeout: float = 5.0,
+                 # the adapter is reached over WiFi, deadlines never go below what a short WiFi hiccup takes
+                 min_timeout: float = 1.5,
+                 max_timeout: float = 10.0,
+                 save_interval: float = 900.0):
+        self.path = path
+        self.default_timeout = default_timeout
+        self.reset_timeout = reset_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.save_interval = save_interval
+        self._histograms: dict[bytes, LatencyHistogram] = {}
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+    def histogram(self, cmd: bytes) -> LatencyHistogram:
+        h = self._histograms.get(cmd)
+        if h is None:
+            h = LatencyHistogram()
+            self._histograms[cmd] = h
+        return h
+
+    def observe(self, cmd: bytes, seconds: float) -> None:
+        self.histogram(cmd).observe(seconds)
+        self._dirty = True
+
+    def observe_timeout(self, cmd: bytes, seconds: float) -> None:
+        # we only know the response took longer than the deadline, record it as the deadline
+        # so the learned quantile moves up and the next deadline is more generous
+        LATENCY_LOG.info("Timeout for %s after %.2fs", cmd, seconds)
+        self.observe(cmd, seconds)
+
+    def learned_latency(self, cmd: bytes) -> Optional[float]:
+        h = self._histograms.get(cmd)
+        if h is None or h.samples < self.MIN_SAMPLES:
+            return None
+        return h.quantile(self.DEADLINE_QUANTILE)
+
+    def read_timeout(self, cmd: bytes) -> float:
+        if request_class(cmd) == REQUEST_CLASS_RESET:
+            return self.reset_timeout
+        latency = self.learned_latency(cmd)
+        if latency is None:
+            return self.default_timeout
+        timeout = latency * self.DEADLINE_FACTOR + self.DEADLINE_MARGIN
+        return min(max(timeout, self.min_timeout), self.max_timeout)
+
+    def response_timeout(self, cmd: bytes) -> Optional[int]:
+        """ATST value (in 4ms units) to use for an ECU request, or None to keep the adapter default."""
+        if request_class(cmd) != REQUEST_CLASS_ECU:
+            return None
+        latency = self.learned_latency(cmd)
+        if latency is None:
+            return None
+        # never go below the adapter default: a too short ATST turns slow replies into NO DATA,
+        # which would then be learned as fast replies
+        value = math.ceil(latency * self.DEADLINE_FACTOR / ATST_UNIT)
+        return min(max(value, ATST_DEFAULT), ATST_MAX)
+
+    def load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            for cmd, h in data.get("commands", {}).items():
+                self._histograms[cmd.encode("ascii")] = LatencyHistogram.from_dict(h)
+            LATENCY_LOG.info("Loaded latency model for %s commands from %s", len(self._histograms), self.path)
+        except Exception as e:
+            LATENCY_LOG.warning("Failed loading latency model from %s: %s", self.path, e)
+
+    def save(self) -> None:
+        self._last_save = time.monotonic()
+        if not self.path or not self._dirty:
+            return
+        data = {
+            "version": 1,
+            "commands": {cmd.decode("ascii"): h.to_dict() for cmd, h in self._histograms.items()},
+        }
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+            LATENCY_LOG.debug("Saved latency model to %s", self.path)
+        except Exception as e:
+            LATENCY_LOG.warning("Failed saving latency model to %s: %s", self.path, e)
+
+    def save_if_due(self) -> None:
+        if time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
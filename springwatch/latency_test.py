@@ -0,0 +1,153 @@
+import pytest
+from springwatch.elm327 import Elm327Communicator, Elm327Session
+from springwatch.latency import ATST_DEFAULT, LatencyHistogram, LatencyModel, request_class
+
+
+class ScriptedSocketMock:
+    def __init__(self, responses: dict[bytes, bytes]):
+        self._responses = responses
+        self._pending = b""
+        self.sent: list[bytes] = []
+        self.timeouts: list[float] = []
+
+    def settimeout(self, timeout: float):
+        self.timeouts.append(timeout)
+
+    def sendall(self, data: bytes):
+        cmd = data.rstrip(b"\r")
+        self.sent.append(cmd)
+        self._pending += self._responses.get(cmd, b"?\r\r>")
+
+    def recv(self, size: int) -> bytes:
+        if not self._pending:
+            raise TimeoutError("timed out")
+        ch = self._pending[:size]
+        self._pending = self._pending[size:]
+        return ch
+
+
+def test_request_class():
+    assert request_class(b"ATZ") == "reset"
+    assert request_class(b"ATRV") == "adapter"
+    assert request_class(b"015B") == "ecu"
+
+
+def test_histogram_quantile():
+    h = LatencyHistogram(decay=1.0)
+    for _ in range(99):
+        h.observe(0.05)
+    h.observe(2.0)
+    assert 0.05 <= h.quantile(0.5) < 0.07
+    assert 2.0 <= h.quantile(1.0) < 2.6
+
+
+def test_histogram_forgets_old_samples():
+    h = LatencyHistogram(decay=0.9)
+    for _ in range(100):
+        h.observe(2.0)
+    for _ in range(100):
+        h.observe(0.05)
+    assert h.quantile(0.99) < 0.1
+
+
+def test_default_timeout_until_warmed_up():
+    model = LatencyModel(default_timeout=3.0)
+    for _ in range(LatencyModel.MIN_SAMPLES - 1):
+        model.observe(b"ATRV", 0.02)
+    assert model.read_timeout(b"ATRV") == 3.0
+    model.observe(b"ATRV", 0.02)
+    assert model.read_timeout(b"ATRV") == model.min_timeout
+    assert model.read_timeout(b"ATZ") == model.reset_timeout
+
+
+def test_timeouts_increase_deadline():
+    model = LatencyModel()
+    for _ in range(50):
+        model.observe(b"015B", 0.3)
+    before = model.read_timeout(b"015B")
+    for _ in range(5):
+        model.observe_timeout(b"015B", before)
+    assert model.read_timeout(b"015B") > before
+
+
+def test_response_timeout_never_below_adapter_default():
+    model = LatencyModel()
+    assert model.response_timeout(b"015B") is None
+    for _ in range(50):
+        model.observe(b"015B", 0.01)
+    assert model.response_timeout(b"015B") == ATST_DEFAULT
+    for _ in range(50):
+        model.observe(b"01B2", 0.6)
+    assert model.response_timeout(b"01B2") > ATST_DEFAULT
+    assert model.response_timeout(b"ATRV") is None
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / "latency.json")
+    model = LatencyModel(path=path)
+    for _ in range(50):
+        model.observe(b"015B", 0.4)
+    model.save()
+    loaded = LatencyModel(path=path)
+    loaded.load()
+    assert loaded.read_timeout(b"015B") == model.read_timeout(b"015B")
+
+
+def test_communicator_uses_learned_deadline():
+    model = LatencyModel()
+    for _ in range(50):
+        model.observe(b"ATRV", 0.02)
+    sock = ScriptedSocketMock({b"ATRV": b"12.6V\r\r>"})
+    comm = Elm327Communicator(sock, model)  # type: ignore
+    assert comm.send_cmd_get_first_line(b"ATRV") == b"12.6V"
+    assert max(sock.timeouts) <= model.min_timeout
+
+
+def test_communicator_records_timeout():
+    model = LatencyModel()
+    sock = ScriptedSocketMock({b"015B": b""})
+    comm = Elm327Communicator(sock, model)  # type: ignore
+    with pytest.raises(TimeoutError):
+        comm.send_cmd_get_first_line(b"015B")
+    assert model.histogram(b"015B").samples == 1
+
+
+class SlowOnceSocketMock(ScriptedSocketMock):
+    def __init__(self, responses: dict[bytes, bytes], slow_cmd: bytes):
+        ScriptedSocketMock.__init__(self, responses)
+        self.slow_cmd = slow_cmd
+
+    def recv(self, size: int) -> bytes:
+        if self.sent[-1] == self.slow_cmd:
+            # the reply only arrives after the learned deadline has passed
+            self.slow_cmd = b""
+            raise TimeoutError("timed out")
+        return ScriptedSocketMock.recv(self, size)
+
+
+def test_one_slow_reply_does_not_end_the_session():
+    model = LatencyModel()
+    for _ in range(50):
+        model.observe(b"015B", 0.01)
+        model.observe(b"ATST32", 0.02)
+    sock = SlowOnceSocketMock({b"015B": b"18DAF1DB03415B80\r\r>", b"ATST32": b"OK\r\r>"}, b"015B")
+    session = Elm327Session(sock, model)  # type: ignore
+    assert session.read_hv_battery_soc() == 0.0
+    # the hung read gave up at the learned deadline, not after the default timeout
+    assert max(sock.timeouts) <= model.min_timeout < model.default_timeout
+    # the late reply is discarded, the next read gets its own reply
+    sock._responses[b"015B"] = b"18DAF1DB03415B40\r\r>"
+    assert session.read_hv_battery_soc() == 0x40 * 100 / 255
+
+
+def test_session_sets_response_timeout_for_slow_ecu():
+    model = LatencyModel()
+    for _ in range(50):
+        model.observe(b"015B", 0.6)
+    sock = ScriptedSocketMock({b"015B": b"18DAF1DB03415B80\r\r>"})
+    sock._responses[b"ATST%02X" % model.response_timeout(b"015B")] = b"OK\r\r>"
+    session = Elm327Session(sock, model)  # type: ignore
+    session.read_hv_battery_soc()
+    session.read_hv_battery_soc()
+    atst = [cmd for cmd in sock.sent if cmd.startswith(b"ATST")]
+    assert len(atst) == 1
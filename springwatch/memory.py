@@ -0,0 +1,71 @@
+import gc
+import logging
+import os
+import resource
+import signal
+import sys
+import tracemalloc
+from typing import Optional
+
+MEMORY_LOG = logging.getLogger("springwatch.memory")
+
+
+def rss_bytes() -> Optional[int]:
+    """Current resident set size, None if the platform does not expose it."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def memory_report(top: int = 10) -> str:
+    lines = []
+    rss = rss_bytes()
+    if rss is not None:
+        lines.append("RSS: %.1f MiB" % (rss / 2**20))
+    lines.append("Peak RSS: %.1f MiB" % (peak_rss_bytes() / 2**20))
+    lines.append("GC objects: %s, collections per generation: %s" % (
+        len(gc.get_objects()), [s["collections"] for s in gc.get_stats()]))
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        lines.append("Traced: %.1f KiB (peak %.1f KiB)" % (current / 1024, peak / 1024))
+        stats = tracemalloc.take_snapshot().statistics("lineno")
+        for stat in stats[:top]:
+            lines.append("  %s" % stat)
+    else:
+        lines.append("tracemalloc not active, set MEMORY_TRACE_FRAMES to enable allocation tracking.")
+    return "\n".join(lines)
+
+
+class MemoryReporter:
+    """Logs a memory report on SIGUSR1, the report is produced from the main loop, not in the signal handler."""
+
+    def __init__(self, trace_frames: int = 0):
+        self._requested = False
+        if trace_frames > 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(trace_frames)
+
+    def install_signal_handler(self) -> None:
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, self._on_signal)
+
+    def _on_signal(self, signum, frame) -> None:
+        self._requested = True
+
+    def request(self) -> None:
+        self._requested = True
+
+    def report_if_requested(self) -> bool:
+        if not self._requested:
+            return False
+        self._requested = False
+        MEMORY_LOG.info("Memory report:\n%s", memory_report())
+        return True
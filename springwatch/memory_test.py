@@ -0,0 +1,103 @@
+from datetime import UTC, datetime
+import gc
+import tracemalloc
+from springwatch.analytics import SessionAnalytics
+from springwatch.clock import VirtualClock
+from springwatch.memory import MemoryReporter, memory_report
+from springwatch.model import CarspecificSettings, ModelPublisher, PollingSettings, SessionSummary, WorldView
+from springwatch.poller import (poll_loop_hv_battery_soc_percent, poll_loop_hv_battery_soh_percent,
+                                poll_loop_lv_battery)
+
+
+class CyclingReaderMock:
+    def __init__(self):
+        self._tick = 0
+        self.hv_reads = 0
+
+    def next_tick(self):
+        self._tick += 1
+
+    def read_device_battery_voltage(self) -> float:
+        return 12.4 + (self._tick % 20) / 10
+
+    def read_hv_battery_soc(self) -> float:
+        self.hv_reads += 1
+        return 20.0 + (self._tick // 60) % 80
+
+    def read_hv_battery_soh(self) -> float:
+        return 97.0
+
+
+class IteratingPublisherMock(ModelPublisher):
+    def __init__(self):
+        self.published = 0
+        self.summaries = 0
+
+    def publish_session_summary(self, summary: SessionSummary) -> None:
+        self.summaries += 1
+
+    def publish(self, world: WorldView) -> None:
+        for reading in world.readings:
+            if reading.value is not None and world.is_from_current_session(reading):
+                self.published += 1
+
+
+def simulate(world: WorldView, clock: VirtualClock, reader: CyclingReaderMock, analytics: SessionAnalytics,
+             publisher: ModelPublisher, ticks: int, offset: int = 0):
+    car = CarspecificSettings()
+    polling = PollingSettings()
+    for i in range(offset, offset + ticks):
+        clock.advance(60)
+        reader.next_tick()
+        # plug in for the night, charge for a few hours, unplug in the morning
+        hour = (i // 60) % 24
+        world.car_connected = hour < 8 or hour >= 18
+        world.charging_enabled = hour < 6
+        world.is_charging = 1 <= hour < 5
+        poll_loop_lv_battery(world, reader)
+        poll_loop_hv_battery_soc_percent(car, world, reader, analytics, polling)
+        poll_loop_hv_battery_soh_percent(car, world, reader, analytics)
+        summary = analytics.update(world, car)
+        if summary:
+            publisher.publish_session_summary(summary)
+        publisher.publish(world)
+
+
+def test_memory_is_flat_over_a_month_of_polling():
+    day = 24 * 60
+    clock = VirtualClock(datetime(2025, 6, 1, tzinfo=UTC))
+    world = WorldView(clock=clock)
+    reader = CyclingReaderMock()
+    analytics = SessionAnalytics()
+    publisher = IteratingPublisherMock()
+    tracemalloc.start()
+    try:
+        simulate(world, clock, reader, analytics, publisher, day)
+        gc.collect()
+        baseline, _ = tracemalloc.get_traced_memory()
+        simulate(world, clock, reader, analytics, publisher, 29 * day, offset=day)
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # every night is a session of its own, polled while charging and periodically
+    assert publisher.summaries >= 29
+    assert reader.hv_reads > 30 * (4 * 60 // 2)
+    assert publisher.published > 0
+    assert current - baseline < 16 * 1024
+
+
+def test_memory_report_on_request(caplog):
+    reporter = MemoryReporter()
+    assert not reporter.report_if_requested()
+    reporter.request()
+    with caplog.at_level("INFO", logger="springwatch.memory"):
+        assert reporter.report_if_requested()
+    assert "Peak RSS" in caplog.text
+    assert "Peak RSS" in memory_report()
+
+
+def test_models_have_no_instance_dict():
+    world = WorldView()
+    assert not hasattr(world, "__dict__")
+    assert not hasattr(world.battery_hv_soc_percent, "__dict__")
@@ -1,45 +1,84 @@
-from datetime import datetime, UTC, timedelta
+from datetime import datetime, timedelta
 from typing import Any, Optional
+from springwatch.clock import SYSTEM_CLOCK, Clock, from_epoch_us, to_epoch_us
 
 SESSION_TIMEOUT_GRACE_MINUTES = 2
+SESSION_TIMEOUT_GRACE_US = SESSION_TIMEOUT_GRACE_MINUTES * 60 * 1_000_000
 
 
 class Reading:
-    def __init__(self, name: str, short_name: str, value: Any = None, last_read: Optional[datetime] = None):
+    __slots__ = ("name", "short_name", "value", "last_read_us", "clock")
+
+    def __init__(self, name: str, short_name: str, value: Any = None, last_read: Optional[datetime] = None,
+                 clock: Clock = SYSTEM_CLOCK):
         self.name = name
         self.short_name = short_name
         self.value = value
-        self.last_read: Optional[datetime] = None
+        self.last_read_us: Optional[int] = to_epoch_us(last_read) if last_read else None
+        self.clock = clock
+
+    @property
+    def last_read(self) -> Optional[datetime]:
+        return from_epoch_us(self.last_read_us)
 
     def update(self, value: Any, ts: Optional[datetime] = None) -> bool:
-        if not ts:
-            ts = datetime.now(UTC)
         changed = self.value != value
         self.value = value
-        self.last_read = ts
+        self.last_read_us = to_epoch_us(ts) if ts else self.clock.now_us()
         return changed
 
 
 class CarspecificSettings:
-    def __init__(self, soc_percent_correction: float = 0.0, soc_almost_full_limit: float = 99.0):
+    __slots__ = ("soc_percent_correction", "soc_almost_full_limit", "battery_capacity_kwh")
+
+    def __init__(self, soc_percent_correction: float = 0.0, soc_almost_full_limit: float = 99.0,
+                 battery_capacity_kwh: float = 26.8):
         self.soc_percent_correction = soc_percent_correction
         self.soc_almost_full_limit = soc_almost_full_limit
+        self.battery_capacity_kwh = battery_capacity_kwh
+
+
+class PollingSettings:
+    __slots__ = ("tick_seconds", "wakeup_interval", "wakeup_full_interval", "charging_interval", "awake_interval",
+                 "periodic_interval")
+
+    def __init__(self,
+                 tick_seconds: float = 3.0,
+                 wakeup_interval: timedelta = timedelta(minutes=1),
+                 wakeup_full_interval: timedelta = timedelta(hours=1),
+                 charging_interval: timedelta = timedelta(minutes=2),
+                 awake_interval: timedelta = timedelta(hours=1),
+                 periodic_interval: timedelta = timedelta(hours=6)):
+        self.tick_seconds = tick_seconds
+        self.wakeup_interval = wakeup_interval
+        self.wakeup_full_interval = wakeup_full_interval
+        self.charging_interval = charging_interval
+        self.awake_interval = awake_interval
+        self.periodic_interval = periodic_interval
 
 
 class WorldView:
-    def __init__(self, sleep_voltage: float = 13.0, car_connected: bool = False):
+    __slots__ = ("_car_connected", "_car_connected_us", "_car_disconnected_us", "_session_start_us",
+                 "_charging_enabled", "_charging_enabled_us", "_is_charging", "_charging_ended_us",
+                 "sleep_voltage", "battery_12v_voltage", "battery_hv_soc_percent", "battery_hv_soh_percent",
+                 "readings", "clock")
+
+    def __init__(self, sleep_voltage: float = 13.0, car_connected: bool = False, clock: Clock = SYSTEM_CLOCK):
+        self.clock = clock
         self._car_connected = False
-        self._car_connected_when: Optional[datetime] = None
-        self._car_disconnected_when: Optional[datetime] = None
-        self._session_start_when: Optional[datetime] = None  # a session may span a few short disconnects
+        self._car_connected_us: Optional[int] = None
+        self._car_disconnected_us: Optional[int] = None
+        self._session_start_us: Optional[int] = None  # a session may span a few short disconnects
         self._charging_enabled = False
-        self._charging_enabled_when: Optional[datetime] = None
+        self._charging_enabled_us: Optional[int] = None
         self._is_charging = False
-        self._charging_ended_when: Optional[datetime] = None
+        self._charging_ended_us: Optional[int] = None
         self.sleep_voltage = sleep_voltage
-        self.battery_12v_voltage = Reading(name="12V Battery Voltage", short_name="12v_voltage")
-        self.battery_hv_soc_percent = Reading(name="HV Battery SoC %", short_name="hv_soc")
-        self.battery_hv_soh_percent = Reading(name="HV Battery SoH %", short_name="hv_soh")
+        self.battery_12v_voltage = Reading(name="12V Battery Voltage", short_name="12v_voltage", clock=clock)
+        self.battery_hv_soc_percent = Reading(name="HV Battery SoC %", short_name="hv_soc", clock=clock)
+        self.battery_hv_soh_percent = Reading(name="HV Battery SoH %", short_name="hv_soh", clock=clock)
+        # built once, so publishers don't need to assemble a new list on every tick
+        self.readings = (self.battery_12v_voltage, self.battery_hv_soc_percent, self.battery_hv_soh_percent)
         # assign properties to trigger correct timestamp behavior
         self.car_connected = car_connected
 
@@ -52,41 +91,46 @@ class WorldView:
         if value == self._car_connected:
             return
         self._car_connected = value
-        now = datetime.now(UTC)
+        now = self.clock.now_us()
         if value:
-            self._car_connected_when = now
-            if self._car_disconnected_when and self._session_start_when:
-                td = now - self._car_disconnected_when
-                if td > timedelta(minutes=SESSION_TIMEOUT_GRACE_MINUTES):
-                    self._session_start_when = None
-            if self._session_start_when is None:
-                self._session_start_when = now
+            self._car_connected_us = now
+            if self._car_disconnected_us and self._session_start_us:
+                if now - self._car_disconnected_us > SESSION_TIMEOUT_GRACE_US:
+                    self._session_start_us = None
+            if self._session_start_us is None:
+                self._session_start_us = now
         else:
-            self._car_disconnected_when = now
+            self._car_disconnected_us = now
 
     @property
     def car_connected_when(self):
-        return self._car_connected_when
+        return from_epoch_us(self._car_connected_us)
+
+    @property
+    def car_disconnected_us(self) -> Optional[int]:
+        return self._car_disconnected_us
 
     @property
     def car_disconnected_when(self):
-        return self._car_disconnected_when
+        return from_epoch_us(self._car_disconnected_us)
 
     @property
-    def session_start_when(self):
-        if self._session_start_when:
+    def session_start_us(self) -> Optional[int]:
+        if self._session_start_us:
             if self.car_connected:
-                return self._session_start_when
-            elif self._car_disconnected_when:
-                now = datetime.now(UTC)
-                td = now - self._car_disconnected_when
-                if td < timedelta(minutes=SESSION_TIMEOUT_GRACE_MINUTES):
-                    return self._session_start_when
+                return self._session_start_us
+            elif self._car_disconnected_us:
+                if self.clock.now_us() - self._car_disconnected_us < SESSION_TIMEOUT_GRACE_US:
+                    return self._session_start_us
         return None
 
+    @property
+    def session_start_when(self):
+        return from_epoch_us(self.session_start_us)
+
     @property
     def session_active(self):
-        return self.session_start_when is not None
+        return self.session_start_us is not None
 
     @property
     def charging_enabled(self):
@@ -96,34 +140,96 @@ class WorldView:
     def charging_enabled(self, value: bool):
         if value != self._charging_enabled:
             self._charging_enabled = value
-            self._charging_enabled_when = datetime.now(UTC) if value else None
+            self._charging_enabled_us = self.clock.now_us() if value else None
+
+    @property
+    def charging_enabled_us(self) -> Optional[int]:
+        return self._charging_enabled_us
 
     @property
     def charging_enabled_when(self):
-        return self._charging_enabled_when
+        return from_epoch_us(self._charging_enabled_us)
 
     @property
     def is_charging(self):
         return self._is_charging
 
+    @property
+    def charging_ended_us(self) -> Optional[int]:
+        return self._charging_ended_us
+
     @property
     def charging_ended_when(self):
-        return self._charging_ended_when
+        return from_epoch_us(self._charging_ended_us)
 
     @is_charging.setter
     def is_charging(self, value: bool):
         if value != self._is_charging:
             self._is_charging = value
-            self._charging_ended_when = None if value else datetime.now(UTC)
+            self._charging_ended_us = None if value else self.clock.now_us()
 
     def is_car_awake(self):
         r = self.battery_12v_voltage
         return self.car_connected and r.value and r.value >= self.sleep_voltage
 
     def is_from_current_session(self, reading: Reading) -> bool:
-        s_when = self.session_start_when
-        r_when = reading.last_read
-        return s_when is not None and r_when is not None and r_when >= s_when
+        s_us = self.session_start_us
+        r_us = reading.last_read_us
+        return s_us is not None and r_us is not None and r_us >= s_us
+
+
+class SessionSummary:
+    __slots__ = ("start", "end", "soc_start", "soc_end", "soc_gained", "soc_rate_avg", "soc_rate_peak",
+                 "energy_added_kwh", "charging_seconds", "enabled_not_charging_seconds", "hv_polls", "lv_voltage_min",
+                 "lv_drain_parked")
+
+    def __init__(self,
+                 start: datetime,
+                 end: datetime,
+                 soc_start: Optional[float],
+                 soc_end: Optional[float],
+                 soc_gained: float,
+                 soc_rate_avg: Optional[float],
+                 soc_rate_peak: Optional[float],
+                 energy_added_kwh: float,
+                 charging_seconds: float,
+                 enabled_not_charging_seconds: float,
+                 hv_polls: int,
+                 lv_voltage_min: Optional[float],
+                 lv_drain_parked: float):
+        self.start = start
+        self.end = end
+        self.soc_start = soc_start
+        self.soc_end = soc_end
+        self.soc_gained = soc_gained
+        self.soc_rate_avg = soc_rate_avg
+        self.soc_rate_peak = soc_rate_peak
+        self.energy_added_kwh = energy_added_kwh
+        self.charging_seconds = charging_seconds
+        self.enabled_not_charging_seconds = enabled_not_charging_seconds
+        self.hv_polls = hv_polls
+        self.lv_voltage_min = lv_voltage_min
+        self.lv_drain_parked = lv_drain_parked
+
+    def to_dict(self) -> dict:
+        def rounded(v: Optional[float], digits: int = 2) -> Optional[float]:
+            return round(v, digits) if v is not None else None
+        return {
+            "start": self.start.isoformat(),
+            "end": self.end.isoformat(),
+            "duration_s": int((self.end - self.start).total_seconds()),
+            "soc_start": rounded(self.soc_start),
+            "soc_end": rounded(self.soc_end),
+            "soc_gained": rounded(self.soc_gained),
+            "soc_rate_avg": rounded(self.soc_rate_avg),
+            "soc_rate_peak": rounded(self.soc_rate_peak),
+            "energy_added_kwh": rounded(self.energy_added_kwh),
+            "charging_s": int(self.charging_seconds),
+            "enabled_not_charging_s": int(self.enabled_not_charging_seconds),
+            "hv_polls": self.hv_polls,
+            "lv_voltage_min": rounded(self.lv_voltage_min),
+            "lv_drain_parked": rounded(self.lv_drain_parked),
+        }
 
 
 class ModelPublisher():
@@ -133,16 +239,38 @@ class ModelPublisher():
     def publish(self, world: WorldView) -> None:
         pass
 
+    def publish_session_summary(self, summary: SessionSummary) -> None:
+        pass
+
+
+class CompositeModelPublisher(ModelPublisher):
+    def __init__(self, publishers: list[ModelPublisher]):
+        ModelPublisher.__init__(self)
+        self.publishers = publishers
+
+    def publish(self, world: WorldView) -> None:
+        for publisher in self.publishers:
+            publisher.publish(world)
+
+    def publish_session_summary(self, summary: SessionSummary) -> None:
+        for publisher in self.publishers:
+            publisher.publish_session_summary(summary)
+
 
 class StdOutModelPublisher(ModelPublisher):
     def __init__(self):
         ModelPublisher.__init__(self)
 
     def publish(self, world: WorldView) -> None:
-        readings = [world.battery_12v_voltage, world.battery_hv_soc_percent, world.battery_hv_soh_percent]
         print("-" * 50)
-        for reading in readings:
+        for reading in world.readings:
             if reading.value is not None:
                 assert reading.last_read
                 print("%-20s: %-6s (%s)" % (reading.name, reading.value, reading.last_read))
         print("-" * 50)
+
+    def publish_session_summary(self, summary: SessionSummary) -> None:
+        print("=" * 50)
+        for key, value in summary.to_dict().items():
+            print("%-25s: %s" % (key, value))
+        print("=" * 50)
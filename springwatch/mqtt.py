@@ -1,8 +1,8 @@
-from datetime import datetime, UTC
 import logging
 import paho.mqtt.publish as publish
 import json
-from springwatch.model import ModelPublisher, WorldView
+from springwatch.clock import from_epoch_us
+from springwatch.model import ModelPublisher, SessionSummary, WorldView
 from enum import Enum
 
 MQTT_LOGGER = logging.getLogger("springwatch.mqtt")
@@ -19,7 +19,7 @@ class MqttModelPublisher(ModelPublisher):
         self.host = host
         self.port = port
         self.base_topic = base_topic
-        self.publish_highwater_mark = datetime.fromtimestamp(0, tz=UTC)
+        self.publish_highwater_mark_us = 0
         # Default to PLAIN if not set or invalid
         if mqtt_format is None or mqtt_format.upper() not in MqttFormat.__members__:
             self.mqtt_format = MqttFormat.PLAIN
@@ -32,25 +32,38 @@ class MqttModelPublisher(ModelPublisher):
             self.host, self.port, self.base_topic, self.mqtt_format
         )
         try:
-            readings = [world.battery_12v_voltage, world.battery_hv_soc_percent, world.battery_hv_soh_percent]
-            msgs = []
-            hwm = self.publish_highwater_mark
-            for reading in readings:
+            msgs = None
+            hwm = self.publish_highwater_mark_us
+            for reading in world.readings:
                 if reading.value is not None and world.is_from_current_session(reading):
-                    assert reading.last_read
-                    if reading.last_read > self.publish_highwater_mark:
+                    last_read_us = reading.last_read_us
+                    assert last_read_us is not None
+                    if last_read_us > self.publish_highwater_mark_us:
                         topic = f"{self.base_topic}/{reading.short_name}"
                         if self.mqtt_format == MqttFormat.PLAIN:
                             payload = str(reading.value)
                         else:
-                            payload = json.dumps({"value": reading.value, "when": reading.last_read.isoformat()})
+                            when = from_epoch_us(last_read_us)
+                            assert when
+                            payload = json.dumps({"value": reading.value, "when": when.isoformat()})
                         msg = {'topic': topic, 'payload': payload, 'retain': True}
+                        if msgs is None:
+                            msgs = []
                         msgs.append(msg)
-                        if reading.last_read > hwm:
-                            hwm = reading.last_read
-            if len(msgs) > 0:
+                        if last_read_us > hwm:
+                            hwm = last_read_us
+            if msgs:
                 publish.multiple(msgs, hostname=self.host, port=self.port)
                 MQTT_LOGGER.debug("Published %s messages.", len(msgs))
-                self.publish_highwater_mark = hwm
+                self.publish_highwater_mark_us = hwm
         except Exception as e:
             MQTT_LOGGER.warning("Failed publishing MQTT messages: %s", str(e))
+
+    def publish_session_summary(self, summary: SessionSummary) -> None:
+        try:
+            topic = f"{self.base_topic}/session"
+            publish.single(topic, payload=json.dumps(summary.to_dict()), retain=True,
+                           hostname=self.host, port=self.port)
+            MQTT_LOGGER.debug("Published session summary.")
+        except Exception as e:
+            MQTT_LOGGER.warning("Failed publishing session summary: %s", str(e))
@@ -1,10 +1,14 @@
-from datetime import UTC, datetime, timedelta
+from datetime import timedelta
 import logging
-import time
 from typing import Optional
-from springwatch.elm327 import Elm327Connection, ReadsDeviceBatteryVoltage, ReadsHvBatterySoc, ReadsHvBatterySoh
-from springwatch.evcc import EvccClient
-from springwatch.model import CarspecificSettings, ModelPublisher, WorldView
+from springwatch.analytics import SessionAnalytics
+from springwatch.cache import CachingAdapter
+from springwatch.config import Runtime
+from springwatch.elm327 import (AdapterLostError, ConnectionHealthSettings, Elm327Connection,
+                                ReadsDeviceBatteryVoltage, ReadsHvBatterySoc, ReadsHvBatterySoh)
+from springwatch.latency import LatencyModel
+from springwatch.clock import ONE_MICROSECOND, SYSTEM_CLOCK, Clock, from_epoch_us
+from springwatch.model import CarspecificSettings, ModelPublisher, PollingSettings, WorldView
 
 
 def poll_loop_lv_battery(world: WorldView, reader: ReadsDeviceBatteryVoltage):
@@ -16,47 +20,62 @@ def poll_loop_lv_battery(world: WorldView, reader: ReadsDeviceBatteryVoltage):
             logging.info("Device voltage changed: %.1fV", v)
 
 
-def should_poll_hv_battery_info(world: WorldView, fully_charged_limit: float):
-    if not world.car_connected or not world.session_start_when:
+DEFAULT_POLLING = PollingSettings()
+
+
+def should_poll_hv_battery_info(world: WorldView, fully_charged_limit: float,
+                                polling: Optional[PollingSettings] = None):
+    if polling is None:
+        polling = DEFAULT_POLLING
+    session_start_us = world.session_start_us
+    if not world.car_connected or not session_start_us:
         return False, "Car is not connected."
     r = world.battery_hv_soc_percent
     if r.value is None:
         return True, "No known value yet."
-    if not r.last_read or r.last_read < world.session_start_when:
+    last_read_us = r.last_read_us
+    if not last_read_us or last_read_us < session_start_us:
         # last value was read last in a previous session
         return True, "Value is from previous session."
-    if world.charging_ended_when and r.last_read < world.charging_ended_when:
+    if world.charging_ended_us and last_read_us < world.charging_ended_us:
         return True, "No update since charge end."
-    if world.charging_enabled and world.charging_enabled_when and r.last_read < world.charging_enabled_when:
+    if world.charging_enabled and world.charging_enabled_us and last_read_us < world.charging_enabled_us:
         return True, "No update since charging enabled."
+    # the reason is only formatted if we actually poll
+    args = None
     if world.charging_enabled and not world.is_charging:
         # this is the wakeup case this is all about...
+        args = (r.value, fully_charged_limit)
         if r.value < fully_charged_limit:
             # battery is not full, we want to wake it up
-            td = timedelta(minutes=1)
-            reason = f"Charging enabled but not charging (battery not full: {r.value}%<{fully_charged_limit}%)..."
+            td = polling.wakeup_interval
+            reason = "Charging enabled but not charging (battery not full: %s%%<%s%%)..."
         else:
             # battery is (almost) full, it's possible the car does not accept any more power
-            td = timedelta(hours=1)
-            reason = f"Charging enabled but not charging (battery almost full: {r.value}%>={fully_charged_limit}%))..."
+            td = polling.wakeup_full_interval
+            reason = "Charging enabled but not charging (battery almost full: %s%%>=%s%%))..."
     elif world.is_charging:
-        td = timedelta(minutes=2)
+        td = polling.charging_interval
         reason = "Currently charging."
     elif world.is_car_awake():
         reason = "Car is awake."
-        td = timedelta(hours=1)
+        td = polling.awake_interval
     else:
         reason = "Periodic check."
-        td = timedelta(hours=6)
-    res = datetime.now(UTC) - r.last_read > td
+        td = polling.periodic_interval
+    res = world.clock.now_us() - last_read_us > td // ONE_MICROSECOND
+    if res and args:
+        reason = reason % args
     return res, reason
 
 
 def poll_loop_hv_battery_soc_percent(car: CarspecificSettings,
                                      world: WorldView,
-                                     reader: ReadsHvBatterySoc
+                                     reader: ReadsHvBatterySoc,
+                                     analytics: Optional[SessionAnalytics] = None,
+                                     polling: Optional[PollingSettings] = None
                                      ) -> Optional[float]:
-    should_poll, reason = should_poll_hv_battery_info(world, car.soc_almost_full_limit)
+    should_poll, reason = should_poll_hv_battery_info(world, car.soc_almost_full_limit, polling)
     if should_poll:
         retries_remaining = 5
         acceptable_min = (max(world.battery_hv_soc_percent.value - 2, 0)
@@ -66,6 +85,8 @@ def poll_loop_hv_battery_soc_percent(car: CarspecificSettings,
         while retries_remaining > 0:
             # for empty value, always require two polls
             logging.info("Polling for HV SoC: %s", reason)
+            if analytics:
+                analytics.record_hv_poll(world)
             raw_soc = reader.read_hv_battery_soc()
             if raw_soc > 0:
                 soc_perc = raw_soc + car.soc_percent_correction
@@ -86,24 +107,27 @@ def poll_loop_hv_battery_soc_percent(car: CarspecificSettings,
 
 
 def should_poll_hv_battery_health_info(world: WorldView):
-    if not world.car_connected or not world.session_start_when:
+    if not world.car_connected or not world.session_active:
         return False, "Car is not connected."
     soc = world.battery_hv_soc_percent
     soh = world.battery_hv_soh_percent
     if soh.value is None:
         return True, "No known value yet."
-    if soc.last_read and soh.last_read and soh.last_read < soc.last_read:
+    if soc.last_read_us and soh.last_read_us and soh.last_read_us < soc.last_read_us:
         return True, "SoH is older than SoC"
     return False, "Information is up-to-date."
 
 
 def poll_loop_hv_battery_soh_percent(car: CarspecificSettings,
                                      world: WorldView,
-                                     reader: ReadsHvBatterySoh
+                                     reader: ReadsHvBatterySoh,
+                                     analytics: Optional[SessionAnalytics] = None
                                      ) -> Optional[float]:
     should_poll, reason = should_poll_hv_battery_health_info(world)
     if should_poll:
         logging.info("Polling for HV SoH: %s", reason)
+        if analytics:
+            analytics.record_hv_poll(world)
         soh = reader.read_hv_battery_soh()
         if soh > 0.0:
             logging.info("HV Battery SoH: %.2f%%", soh)
@@ -111,49 +135,93 @@ def poll_loop_hv_battery_soh_percent(car: CarspecificSettings,
     return None
 
 
-def poll_loop(car: CarspecificSettings, world: WorldView, elm327_con: Elm327Connection,
-              evcc: Optional[EvccClient], publisher: ModelPublisher):
-    with elm327_con.new_session() as session:
+def update_session_analytics(car: CarspecificSettings, world: WorldView, analytics: SessionAnalytics,
+                             publisher: ModelPublisher):
+    summary = analytics.update(world, car)
+    if summary:
+        logging.info("Session summary: %s", summary.to_dict())
+        publisher.publish_session_summary(summary)
+
+
+def idle_with_heartbeat(session: CachingAdapter, health: ConnectionHealthSettings, seconds: float,
+                        clock: Clock = SYSTEM_CLOCK):
+    # sleep until the next tick, but make sure the adapter is still there if we don't talk to it for a while
+    end = clock.monotonic() + seconds
+    while True:
+        remaining = end - clock.monotonic()
+        if remaining <= 0:
+            return
+        idle = session.idle_seconds()
+        if idle >= health.heartbeat_interval:
+            session.heartbeat(health.heartbeat_timeout)
+            idle = 0.0
+        clock.sleep(min(remaining, health.heartbeat_interval - idle))
+
+
+def poll_loop(runtime: Runtime, world: WorldView, elm327_con: Elm327Connection,
+              analytics: Optional[SessionAnalytics] = None):
+    if analytics is None:
+        analytics = SessionAnalytics()
+    with elm327_con.new_session() as session, CachingAdapter(session) as adapter:
         world.car_connected = True
-        if world.session_start_when:
+        session_start_us = world.session_start_us
+        if session_start_us:
             logging.info("Session Info: started=%s (%s ago)",
-                         world.session_start_when,
-                         datetime.now(UTC) - world.session_start_when)
+                         from_epoch_us(session_start_us),
+                         timedelta(microseconds=world.clock.now_us() - session_start_us))
         while True:
             logging.debug("poll_loop loop start.")
-            if evcc:
-                evcc.update(world)
-            poll_loop_lv_battery(world, session)
-            poll_loop_hv_battery_soc_percent(car, world, session)
-            poll_loop_hv_battery_soh_percent(car, world, session)
-            publisher.publish(world)
-            logging.debug("poll_loop loop end. Sleeping 3 seconds")
-            time.sleep(3)
+            runtime.housekeeping(world)
+            car = runtime.car
+            if runtime.evcc:
+                runtime.evcc.update(world)
+            poll_loop_lv_battery(world, adapter)
+            poll_loop_hv_battery_soc_percent(car, world, adapter, analytics, runtime.polling)
+            poll_loop_hv_battery_soh_percent(car, world, adapter, analytics)
+            update_session_analytics(car, world, analytics, runtime.publisher)
+            runtime.publisher.publish(world)
+            elm327_con.latency.save_if_due()
+            logging.debug("poll_loop loop end. Sleeping %s seconds", runtime.polling.tick_seconds)
+            idle_with_heartbeat(adapter, elm327_con.health, runtime.polling.tick_seconds, world.clock)
 
 
-def main_loop(car: CarspecificSettings,
+def main_loop(runtime: Runtime,
               world: WorldView,
-              evcc: Optional[EvccClient],
-              publisher: ModelPublisher,
-              elm327_host: str, elm327_port: int):
+              elm327_host: str, elm327_port: int,
+              latency: Optional[LatencyModel] = None,
+              health: Optional[ConnectionHealthSettings] = None,
+              analytics: Optional[SessionAnalytics] = None):
+    if latency is None:
+        latency = LatencyModel()
+    if analytics is None:
+        analytics = SessionAnalytics()
     while True:
         world.car_connected = False
         logging.info("Waiting for elm327 device to be reachable...")
-        with Elm327Connection(elm327_host, elm327_port) as con:
+        adapter_lost = False
+        with Elm327Connection(elm327_host, elm327_port, latency=latency, health=health) as con:
             last_session_start_when = world.session_start_when
             while not con.connect():
                 logging.debug("Not connected. session_start_when=%s", world.session_start_when)
                 # re-attempt connection in 1 second
-                time.sleep(1)
+                world.clock.sleep(1)
+                runtime.housekeeping(world)
+                update_session_analytics(runtime.car, world, analytics, runtime.publisher)
+                runtime.publish_state(world)
                 if last_session_start_when != world.session_start_when and not world.session_active:
                     logging.info("Session timed out.")
                     last_session_start_when = world.session_start_when
             logging.info("Connection to car established.")
             try:
-                poll_loop(car=car, world=world, elm327_con=con, evcc=evcc, publisher=publisher)
+                poll_loop(runtime=runtime, world=world, elm327_con=con, analytics=analytics)
+            except AdapterLostError as e:
+                logging.warning("Adapter lost: %s", str(e))
+                adapter_lost = True
             except Exception as e:
                 logging.warning("Error in main processing loop: %s", str(e))
             finally:
                 world.car_connected = False
+                latency.save()
         logging.info("Monitoring session completed.")
-        time.sleep(1)
+        if not adapter_lost:
+            world.clock.sleep(1)
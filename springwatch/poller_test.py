@@ -1,7 +1,9 @@
 
-from datetime import UTC, datetime
-from springwatch.model import CarspecificSettings, WorldView
-from springwatch.poller import poll_loop_hv_battery_soc_percent
+from datetime import UTC, datetime, timedelta
+from springwatch.clock import VirtualClock
+from springwatch.elm327 import ConnectionHealthSettings
+from springwatch.model import CarspecificSettings, PollingSettings, WorldView
+from springwatch.poller import idle_with_heartbeat, poll_loop_hv_battery_soc_percent, should_poll_hv_battery_info
 
 
 class StaticHvReaderMock:
@@ -43,3 +45,43 @@ def test_poll_hv_bigger_change_only_after_retry():
     soc = poll_loop_hv_battery_soc_percent(car=CarspecificSettings(), world=world,
                                            reader=ListHvReaderMock([96.5, 95.0, 95.0]))
     assert soc == 95
+
+
+class HeartbeatSessionMock:
+    def __init__(self, clock: VirtualClock):
+        self.heartbeats = 0
+        self._clock = clock
+        self._last_activity = clock.monotonic()
+
+    def idle_seconds(self) -> float:
+        return self._clock.monotonic() - self._last_activity
+
+    def heartbeat(self, timeout: float):
+        self.heartbeats += 1
+        self._last_activity = self._clock.monotonic()
+
+
+def test_idle_sends_heartbeats_while_waiting_for_next_tick():
+    clock = VirtualClock()
+    session = HeartbeatSessionMock(clock)
+    health = ConnectionHealthSettings(heartbeat_interval=1.0, heartbeat_timeout=0.5)
+    idle_with_heartbeat(session, health, 3.5, clock)  # type: ignore
+    assert session.heartbeats == 3
+    assert clock.monotonic() == 3.5
+
+
+def test_poll_hv_wakeup_interval_is_configurable():
+    clock = VirtualClock(datetime(2025, 6, 1, 18, 0, tzinfo=UTC))
+    world = WorldView(car_connected=True, clock=clock)
+    world.charging_enabled = True
+    clock.advance(7 * 60)
+    world.battery_hv_soc_percent.update(50.0)
+    clock.advance(3 * 60)
+    should_poll, _ = should_poll_hv_battery_info(world, 99.0)
+    assert should_poll
+    polling = PollingSettings(wakeup_interval=timedelta(minutes=5))
+    should_poll, _ = should_poll_hv_battery_info(world, 99.0, polling)
+    assert not should_poll
+    clock.advance(2 * 60 + 1)
+    should_poll, _ = should_poll_hv_battery_info(world, 99.0, polling)
+    assert should_poll
@@ -0,0 +1,433 @@
+"""
+Discrete-event simulation of car, evcc loadpoint and adapter to evaluate polling policies.
+
+The poller functions run unchanged against a VirtualClock, so weeks of polling take seconds:
+
+    python -m springwatch.simulator --days 14
+"""
+import argparse
+import csv
+from datetime import UTC, datetime, timedelta
+import heapq
+import json
+import logging
+import os
+import random
+from typing import Callable, Optional
+from springwatch.analytics import SessionAnalytics
+from springwatch.clock import VirtualClock
+from springwatch.config import Config, ConfigReloader
+from springwatch.model import SESSION_TIMEOUT_GRACE_US, CarspecificSettings, PollingSettings, SessionSummary, WorldView
+from springwatch.poller import poll_loop_hv_battery_soc_percent, poll_loop_hv_battery_soh_percent, poll_loop_lv_battery
+
+US_PER_SECOND = 1_000_000
+US_PER_HOUR = 3600 * US_PER_SECOND
+
+
+class SimCar:
+    """
+    Dacia Spring as seen by the poller: the HV system goes to sleep a few minutes after charging stops
+    and only accepts power again once something (plugging in or an OBD query) wakes it up.
+    """
+
+    def __init__(self, clock: VirtualClock, soc: float = 50.0, soh: float = 96.0, capacity_kwh: float = 26.8,
+                 charge_power_kw: float = 6.6, hv_awake_seconds: float = 300.0):
+        self.clock = clock
+        self.soc = soc
+        self.soh = soh
+        self.capacity_kwh = capacity_kwh
+        self.charge_power_kw = charge_power_kw
+        self.hv_awake_us = int(hv_awake_seconds * US_PER_SECOND)
+        self.plugged = False
+        self.charge_enabled = False
+        self.charging = False
+        self.lv_voltage = 12.7
+        self.hv_awake_until = 0
+        self.hv_wakeups = 0
+        self.charged_kwh = 0.0
+        self._last_us = clock.now_us()
+
+    @property
+    def hv_awake(self) -> bool:
+        return self.clock.now_us() < self.hv_awake_until
+
+    def wake(self) -> None:
+        if not self.hv_awake:
+            self.hv_wakeups += 1
+        self.hv_awake_until = self.clock.now_us() + self.hv_awake_us
+
+    def plug(self, plugged: bool) -> None:
+        self.advance()
+        self.plugged = plugged
+        if plugged:
+            self.wake()
+
+    def drive(self, consumed_percent: float) -> None:
+        self.advance()
+        self.soc = max(self.soc - consumed_percent, 5.0)
+
+    def advance(self) -> None:
+        now = self.clock.now_us()
+        hours = (now - self._last_us) / US_PER_HOUR
+        self._last_us = now
+        if self.charging:
+            added = min(self.charge_power_kw * hours, (100.0 - self.soc) * self.capacity_kwh / 100)
+            self.soc += added / self.capacity_kwh * 100
+            self.charged_kwh += added
+            self.hv_awake_until = max(self.hv_awake_until, now + self.hv_awake_us)
+        elif not self.hv_awake:
+            self.lv_voltage = max(self.lv_voltage - 0.002 * hours, 11.8)
+        self.charging = self.plugged and self.charge_enabled and self.hv_awake and self.soc < 100.0
+        if self.charging or self.hv_awake:
+            self.lv_voltage = 14.2 if self.charging else 13.5
+        elif self.lv_voltage > 12.7:
+            self.lv_voltage = 12.7
+
+
+class SimLoadpoint:
+    """Stands in for EvccClient, reports the loadpoint state to the WorldView."""
+
+    def __init__(self, car: SimCar):
+        self.car = car
+        self.enabled = False
+
+    def set_enabled(self, enabled: bool) -> None:
+        self.car.advance()
+        self.enabled = enabled
+        self.car.charge_enabled = enabled
+
+    def update(self, world: WorldView) -> None:
+        world.charging_enabled = self.enabled and self.car.plugged
+        world.is_charging = self.car.charging
+
+
+class SimAdapter:
+    """Adapter in the car, ATRV is answered by the adapter itself, everything else is a bus query."""
+
+    def __init__(self, car: SimCar, soc_percent_correction: float = 0.0):
+        self.car = car
+        self.soc_percent_correction = soc_percent_correction
+        self.bus_queries = 0
+
+    def read_device_battery_voltage(self) -> float:
+        self.car.advance()
+        return round(self.car.lv_voltage, 1)
+
+    def _query_hv(self) -> None:
+        self.bus_queries += 1
+        self.car.advance()
+        self.car.wake()
+        self.car.advance()
+
+    def read_hv_battery_soc(self) -> float:
+        self._query_hv()
+        # the car reports SoC in steps of 1/255
+        return round(self.car.soc * 255 / 100) * 100 / 255 - self.soc_percent_correction
+
+    def read_hv_battery_soh(self) -> float:
+        self._query_hv()
+        return round(self.car.soh * 255 / 100) * 100 / 255
+
+
+class Scenario:
+    """Charging pattern of one car, expressed as events: (offset from simulation start, action)."""
+
+    def __init__(self, name: str, events: Callable[[int, random.Random], list[tuple[timedelta, str, float]]]):
+        self.name = name
+        self.events = events
+
+
+def commuter_events(days: int, rnd: random.Random) -> list[tuple[timedelta, str, float]]:
+    # away during the day on weekdays, charging enabled from midnight to 6 (off-peak tariff)
+    events = []
+    for day in range(days):
+        base = timedelta(days=day)
+        events.append((base + timedelta(hours=0), "enable", 1))
+        events.append((base + timedelta(hours=6), "enable", 0))
+        if day % 7 < 5:
+            depart = base + timedelta(hours=7, minutes=rnd.randint(0, 60))
+            arrive = base + timedelta(hours=17, minutes=rnd.randint(0, 120))
+            events.append((depart, "plug", 0))
+            events.append((arrive, "drive", rnd.uniform(8, 20)))
+            events.append((arrive + timedelta(minutes=rnd.randint(1, 30)), "plug", 1))
+    return events
+
+
+def pv_surplus_events(days: int, rnd: random.Random) -> list[tuple[timedelta, str, float]]:
+    # mostly at home, evcc enables and disables charging as clouds pass during the day
+    events = []
+    for day in range(days):
+        base = timedelta(days=day)
+        t = base + timedelta(hours=9, minutes=rnd.randint(0, 60))
+        end = base + timedelta(hours=17, minutes=rnd.randint(0, 60))
+        while t < end:
+            on = timedelta(minutes=rnd.randint(10, 90))
+            off = timedelta(minutes=rnd.randint(10, 60))
+            events.append((t, "enable", 1))
+            events.append((min(t + on, end), "enable", 0))
+            t = t + on + off
+        if rnd.random() < 0.4:
+            depart = base + timedelta(hours=rnd.randint(8, 15))
+            events.append((depart, "plug", 0))
+            events.append((depart + timedelta(hours=2), "drive", rnd.uniform(5, 15)))
+            events.append((depart + timedelta(hours=2, minutes=5), "plug", 1))
+    return events
+
+
+SCENARIOS = {
+    "commuter": Scenario("commuter", commuter_events),
+    "pv_surplus": Scenario("pv_surplus", pv_surplus_events),
+}
+
+ACTIONS = ("plug", "enable", "drive")
+
+
+def _parse_time(value: str) -> datetime:
+    ts = datetime.fromisoformat(value)
+    return ts if ts.tzinfo else ts.replace(tzinfo=UTC)
+
+
+def read_event_csv(path: str) -> list[tuple[datetime, str, float]]:
+    """Reads recorded events from a CSV file with the columns time (ISO 8601), action and value."""
+    events = []
+    with open(path, newline="") as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            action = row["action"].strip()
+            if action not in ACTIONS:
+                raise ValueError(f"{path}:{line}: unknown action {action}")
+            events.append((_parse_time(row["time"].strip()), action, float(row["value"])))
+    return events
+
+
+def read_session_summaries(path: str) -> list[tuple[datetime, str, float]]:
+    """
+    Derives events from recorded session summaries, as published to <MQTT_BASE_TOPIC>/session.
+
+    Accepts a JSON list or one summary per line. A session is plugged in from start to end, with charging
+    enabled at the start for as long as the car charged and waited for power. The SoC lost between two
+    sessions is driven just before the next one.
+    """
+    with open(path) as f:
+        content = f.read().strip()
+    if content.startswith("["):
+        summaries = json.loads(content)
+    else:
+        summaries = [json.loads(line) for line in content.splitlines() if line.strip()]
+    events = []
+    previous_soc_end = None
+    for summary in sorted(summaries, key=lambda s: s["start"]):
+        start, end = _parse_time(summary["start"]), _parse_time(summary["end"])
+        soc_start = summary.get("soc_start")
+        if previous_soc_end is not None and soc_start is not None and previous_soc_end > soc_start:
+            events.append((start, "drive", previous_soc_end - soc_start))
+        events.append((start, "plug", 1))
+        enabled = summary.get("charging_s", 0) + summary.get("enabled_not_charging_s", 0)
+        if enabled > 0:
+            events.append((start, "enable", 1))
+            events.append((min(start + timedelta(seconds=enabled), end), "enable", 0))
+        events.append((end, "plug", 0))
+        previous_soc_end = summary.get("soc_end") or previous_soc_end
+    return events
+
+
+def load_scenario(path: str) -> Scenario:
+    """
+    Scenario replaying recorded events (CSV) or session summaries (JSON).
+
+    Times of day are kept, the recording is repeated in whole days to cover the simulated days.
+    """
+    recorded = read_event_csv(path) if path.endswith(".csv") else read_session_summaries(path)
+    if not recorded:
+        raise ValueError(f"{path}: no events")
+    first = min(ts for ts, _, _ in recorded)
+    origin = first.replace(hour=0, minute=0, second=0, microsecond=0)
+    offsets = [(ts - origin, action, value) for ts, action, value in recorded]
+    period = timedelta(days=max(offset for offset, _, _ in offsets).days + 1)
+
+    def events(days: int, rnd: random.Random) -> list[tuple[timedelta, str, float]]:
+        result = []
+        cycle = timedelta(0)
+        while cycle < timedelta(days=days):
+            result.extend((cycle + offset, action, value) for offset, action, value in offsets
+                          if cycle + offset < timedelta(days=days))
+            cycle += period
+        return result
+
+    return Scenario(os.path.splitext(os.path.basename(path))[0], events)
+
+
+POLICIES = {
+    "default": PollingSettings(),
+    "relaxed": PollingSettings(wakeup_interval=timedelta(minutes=5), charging_interval=timedelta(minutes=10),
+                               awake_interval=timedelta(hours=2), periodic_interval=timedelta(hours=12)),
+    "aggressive": PollingSettings(wakeup_interval=timedelta(seconds=30), charging_interval=timedelta(minutes=1),
+                                  awake_interval=timedelta(minutes=30), periodic_interval=timedelta(hours=3)),
+}
+
+
+class SimulationReport:
+    def __init__(self, scenario: str, policy: str):
+        self.scenario = scenario
+        self.policy = policy
+        self.days = 0.0
+        self.hv_wakeups = 0
+        self.poll_hv_wakeups = 0
+        self.bus_queries = 0
+        self.charged_kwh = 0.0
+        self.enabled_not_charging_hours = 0.0
+        self.soc_error_avg = 0.0
+        self.soc_error_max = 0.0
+        self.soc_age_avg_minutes = 0.0
+        self.soc_age_max_minutes = 0.0
+        self.sessions = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "scenario": self.scenario,
+            "policy": self.policy,
+            "days": round(self.days, 1),
+            "sessions": self.sessions,
+            "hv_wakeups": self.hv_wakeups,
+            "poll_hv_wakeups": self.poll_hv_wakeups,
+            "bus_queries": self.bus_queries,
+            "charged_kwh": round(self.charged_kwh, 1),
+            "enabled_not_charging_h": round(self.enabled_not_charging_hours, 1),
+            "soc_error_avg": round(self.soc_error_avg, 2),
+            "soc_error_max": round(self.soc_error_max, 2),
+            "soc_age_avg_min": round(self.soc_age_avg_minutes, 1),
+            "soc_age_max_min": round(self.soc_age_max_minutes, 1),
+        }
+
+
+def _record_summary(report: SimulationReport, summary: Optional[SessionSummary]) -> None:
+    if summary:
+        report.sessions += 1
+        report.enabled_not_charging_hours += summary.enabled_not_charging_seconds / 3600
+
+
+def simulate(scenario: Scenario, policy_name: str, policy: PollingSettings, days: int = 14, seed: int = 1,
+             start: datetime = datetime(2025, 6, 2, tzinfo=UTC),
+             car_settings: Optional[CarspecificSettings] = None,
+             tick_seconds: Optional[float] = None) -> SimulationReport:
+    """
+    Runs the scenario against the polling policy.
+
+    The poll ticks and the scenario events are the events of the simulation, time jumps from one to the next.
+    While the car is away there is nothing to poll and the simulation skips ahead to the next scenario event.
+    A tick coarser than the policy's speeds up long runs, every poll is then late by up to one tick.
+    """
+    if car_settings is None:
+        car_settings = CarspecificSettings()
+    rnd = random.Random(seed)
+    clock = VirtualClock(start)
+    car = SimCar(clock, capacity_kwh=car_settings.battery_capacity_kwh)
+    car.plugged = True
+    loadpoint = SimLoadpoint(car)
+    adapter = SimAdapter(car, car_settings.soc_percent_correction)
+    world = WorldView(clock=clock)
+    analytics = SessionAnalytics()
+    report = SimulationReport(scenario.name, policy_name)
+
+    start_us = clock.now_us()
+    end_us = start_us + days * 24 * US_PER_HOUR
+    tick_us = int((tick_seconds or policy.tick_seconds) * US_PER_SECOND)
+    queue = [(start_us + int(offset.total_seconds() * US_PER_SECOND), i, action, value)
+             for i, (offset, action, value) in enumerate(scenario.events(days, rnd))]
+    heapq.heapify(queue)
+
+    samples = 0
+    soc_error_sum = 0.0
+    soc_age_sum = 0
+    next_tick = start_us
+    while next_tick < end_us:
+        # apply all scenario events up to the next tick
+        while queue and queue[0][0] <= next_tick:
+            when, _, action, value = heapq.heappop(queue)
+            clock.advance((when - clock.now_us()) / US_PER_SECOND)
+            if action == "plug":
+                car.plug(bool(value))
+            elif action == "enable":
+                loadpoint.set_enabled(bool(value))
+            elif action == "drive":
+                car.drive(value)
+        clock.advance((next_tick - clock.now_us()) / US_PER_SECOND)
+        car.advance()
+
+        # the adapter is only reachable while the car is at home
+        world.car_connected = car.plugged
+        loadpoint.update(world)
+        if car.plugged:
+            poll_loop_lv_battery(world, adapter)
+            wakeups = car.hv_wakeups
+            poll_loop_hv_battery_soc_percent(car_settings, world, adapter, analytics, policy)
+            poll_loop_hv_battery_soh_percent(car_settings, world, adapter, analytics)
+            report.poll_hv_wakeups += car.hv_wakeups - wakeups
+            r = world.battery_hv_soc_percent
+            if r.value is not None and r.last_read_us is not None:
+                error = abs(r.value - car.soc)
+                age = clock.now_us() - r.last_read_us
+                samples += 1
+                soc_error_sum += error
+                soc_age_sum += age
+                report.soc_error_max = max(report.soc_error_max, error)
+                report.soc_age_max_minutes = max(report.soc_age_max_minutes, age / US_PER_SECOND / 60)
+        _record_summary(report, analytics.update(world, car_settings))
+        next_tick += tick_us
+        if not car.plugged and queue and queue[0][0] > next_tick:
+            next_tick += (queue[0][0] - next_tick + tick_us - 1) // tick_us * tick_us
+
+    report.days = (clock.now_us() - start_us) / (24 * US_PER_HOUR)
+    report.hv_wakeups = car.hv_wakeups
+    report.bus_queries = adapter.bus_queries
+    report.charged_kwh = car.charged_kwh
+    # close the last session so it is part of the report
+    world.car_connected = False
+    clock.advance(SESSION_TIMEOUT_GRACE_US / US_PER_SECOND)
+    _record_summary(report, analytics.update(world, car_settings))
+    if samples:
+        report.soc_error_avg = soc_error_sum / samples
+        report.soc_age_avg_minutes = soc_age_sum / samples / US_PER_SECOND / 60
+    return report
+
+
+def print_reports(reports: list[SimulationReport]) -> None:
+    rows = [r.to_dict() for r in reports]
+    columns = list(rows[0].keys())
+    widths = [max(len(c), *(len(str(row[c])) for row in rows)) for c in columns]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row[c]).ljust(w) for c, w in zip(columns, widths)))
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Evaluate polling policies against simulated charging patterns.")
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--scenario", choices=list(SCENARIOS), action="append")
+    parser.add_argument("--scenario-file", metavar="FILE", action="append",
+                        help="replay recorded events (.csv: time,action,value) or session summaries (.json)")
+    parser.add_argument("--policy", choices=list(POLICIES), action="append")
+    parser.add_argument("--tick", type=float, default=10.0,
+                        help="simulated poll tick in seconds, use 0 for the tick of each policy")
+    parser.add_argument("--env", metavar="DOTENV", help="also evaluate the polling settings configured in this file")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    policies = {name: POLICIES[name] for name in args.policy or list(POLICIES)}
+    car_settings = None
+    if args.env:
+        config = Config(ConfigReloader(base_env=os.environ, dotenv_path=args.env).env(), log=False)
+        policies["configured"] = config.polling_settings()
+        car_settings = config.car_settings()
+    scenarios = [SCENARIOS[name] for name in args.scenario or []]
+    scenarios += [load_scenario(path) for path in args.scenario_file or []]
+    reports = []
+    for scenario in scenarios or list(SCENARIOS.values()):
+        for policy_name, policy in policies.items():
+            reports.append(simulate(scenario, policy_name, policy,
+                                    days=args.days, seed=args.seed, car_settings=car_settings,
+                                    tick_seconds=args.tick or None))
+    print_reports(reports)
+
+
+if __name__ == "__main__":
+    main()
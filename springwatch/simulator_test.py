@@ -0,0 +1,80 @@
+from datetime import UTC, datetime, timedelta
+import json
+import random
+from springwatch.clock import VirtualClock
+from springwatch.simulator import POLICIES, SCENARIOS, SimAdapter, SimCar, load_scenario, simulate
+
+
+def test_sleeping_car_only_charges_after_wakeup():
+    clock = VirtualClock(datetime(2025, 6, 2, tzinfo=UTC))
+    car = SimCar(clock, soc=50.0)
+    car.plug(True)
+    clock.advance(600)
+    car.advance()
+    assert not car.hv_awake
+    car.charge_enabled = True
+    clock.advance(600)
+    car.advance()
+    assert not car.charging
+    assert SimAdapter(car).read_hv_battery_soc() > 49.0
+    assert car.hv_wakeups == 2
+    clock.advance(3600)
+    car.advance()
+    assert car.charging
+    assert car.soc > 70.0
+
+
+def test_simulation_reports_wakeups_queries_and_staleness():
+    report = simulate(SCENARIOS["commuter"], "default", POLICIES["default"], days=3, tick_seconds=30)
+    assert round(report.days) == 3
+    assert report.hv_wakeups >= report.poll_hv_wakeups > 0
+    assert report.bus_queries > 0
+    assert report.sessions > 0
+    assert report.charged_kwh > 0
+    assert 0 < report.soc_age_avg_minutes <= report.soc_age_max_minutes
+    assert report.soc_error_avg <= report.soc_error_max
+
+
+def test_policies_can_be_compared():
+    relaxed = simulate(SCENARIOS["pv_surplus"], "relaxed", POLICIES["relaxed"], days=3, seed=7, tick_seconds=30)
+    aggressive = simulate(SCENARIOS["pv_surplus"], "aggressive", POLICIES["aggressive"], days=3, seed=7,
+                          tick_seconds=30)
+    assert relaxed.bus_queries < aggressive.bus_queries
+    assert relaxed.soc_age_avg_minutes > aggressive.soc_age_avg_minutes
+    again = simulate(SCENARIOS["pv_surplus"], "relaxed", POLICIES["relaxed"], days=3, seed=7, tick_seconds=30)
+    assert again.to_dict() == relaxed.to_dict()
+
+
+def test_recorded_events_are_replayed(tmp_path):
+    path = tmp_path / "garage.csv"
+    path.write_text("time,action,value\n"
+                    "2025-05-05T07:30:00+00:00,plug,0\n"
+                    "2025-05-05T17:45:00+00:00,drive,12.5\n"
+                    "2025-05-05T18:00:00+00:00,plug,1\n"
+                    "2025-05-05T22:00:00+00:00,enable,1\n"
+                    "2025-05-05T23:30:00+00:00,enable,0\n")
+    scenario = load_scenario(str(path))
+    assert scenario.name == "garage"
+    events = scenario.events(2, random.Random(1))
+    assert len(events) == 10
+    assert events[0] == (timedelta(hours=7, minutes=30), "plug", 0)
+    assert events[5] == (timedelta(days=1, hours=7, minutes=30), "plug", 0)
+    report = simulate(scenario, "default", POLICIES["default"], days=2, tick_seconds=30)
+    assert report.charged_kwh > 0
+
+
+def test_session_summaries_are_replayed(tmp_path):
+    path = tmp_path / "sessions.json"
+    sessions = [
+        {"start": "2025-05-05T18:00:00+00:00", "end": "2025-05-06T07:30:00+00:00", "soc_start": 40.0,
+         "soc_end": 80.0, "charging_s": 3 * 3600, "enabled_not_charging_s": 600},
+        {"start": "2025-05-06T18:00:00+00:00", "end": "2025-05-07T07:30:00+00:00", "soc_start": 65.0,
+         "soc_end": 90.0, "charging_s": 2 * 3600, "enabled_not_charging_s": 0},
+    ]
+    path.write_text("\n".join(json.dumps(s) for s in sessions))
+    events = load_scenario(str(path)).events(3, random.Random(1))
+    assert (timedelta(hours=18), "plug", 1) in events
+    assert (timedelta(hours=21, minutes=10), "enable", 0) in events
+    assert (timedelta(days=1, hours=18), "drive", 15.0) in events
+    assert events.index((timedelta(days=1, hours=18), "drive", 15.0)) < events.index(
+        (timedelta(days=1, hours=18), "plug", 1))
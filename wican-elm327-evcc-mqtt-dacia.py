@@ -3,11 +3,13 @@ import logging
 import os
 import sys
 from dotenv import load_dotenv
-from springwatch.evcc import EvccClient
-from springwatch.model import CarspecificSettings, ModelPublisher, StdOutModelPublisher, WorldView
-from typing import Optional
+from springwatch.config import Config, ConfigReloader, Runtime
+from springwatch.elm327 import ConnectionHealthSettings
+from springwatch.http_api import HttpStatePublisher, HttpStateServer, StateStore
+from springwatch.latency import LatencyModel
+from springwatch.memory import MemoryReporter
+from springwatch.model import WorldView
 
-from springwatch.mqtt import MqttModelPublisher
 from springwatch.poller import main_loop
 
 
@@ -27,59 +29,36 @@ CON_LOG.setLevel(logging.INFO)
 
 # ===============  LOAD ENVIRONMENT ===============
 
+# remember the environment before .env is applied, reloads re-read .env on top of it
+reloader = ConfigReloader(base_env=os.environ)
 load_dotenv()
 
-
-def print_and_get_required_env(env: str, default: Optional[str] = None) -> str:
-    val = os.getenv(env, default=default)
-    if val is None:
-        raise Exception(f"Missing required environment variable {env}")
-    logging.info("%-25s = %s", env, val)
-    return val
-
-
 try:
     logging.info("-" * 40)
-    WICAN_IP = print_and_get_required_env("ELM327_HOST", default="127.0.0.1")
-    WICAN_ELM327_PORT = int(print_and_get_required_env("ELM327_PORT", default="3333"))
-    SOC_PERCENT_CORRECTION = float(print_and_get_required_env("SOC_PERCENT_CORRECTION", "0.0"))
-    SOC_ALMOST_FULL_LIMIT = float(print_and_get_required_env("SOC_ALMOST_FULL_LIMIT", "99.0"))
-    OBD2_SLEEP_VOLTAGE = float(print_and_get_required_env("OBD2_SLEEP_VOLTAGE", "13.0"))
-    MODEL_PUBLISHER = print_and_get_required_env("MODEL_PUBLISHER", "none")
-    MQTT_BROKER_HOST = print_and_get_required_env("MQTT_BROKER_HOST", "127.0.0.1")
-    MQTT_BROKER_PORT = int(print_and_get_required_env("MQTT_BROKER_PORT", "1883"))
-    MQTT_BASE_TOPIC = print_and_get_required_env("MQTT_BASE_TOPIC", f"springwatch/{WICAN_IP}")
-    MQTT_FORMAT = print_and_get_required_env("MQTT_FORMAT", "PLAIN")
-    EVCC_URL = print_and_get_required_env("EVCC_URL", "")
-    EVCC_LOADPOINT_ID = int(print_and_get_required_env("EVCC_LOADPOINT_ID", "1"))
+    config = Config(os.environ)
     logging.info("-" * 40)
 except Exception as e:
     logging.critical(str(e))
     exit(1)
 
-MODEL_PUBLISHER_FACTORIES = {
-    "none": lambda: ModelPublisher(),
-    "stdout": lambda: StdOutModelPublisher(),
-    "mqtt": lambda: MqttModelPublisher(
-        host=MQTT_BROKER_HOST,
-        port=MQTT_BROKER_PORT,
-        base_topic=MQTT_BASE_TOPIC,
-        mqtt_format=MQTT_FORMAT
-    )
-}
-
 
 # =============== LOGIC ===============
 
-world = WorldView(sleep_voltage=OBD2_SLEEP_VOLTAGE)
-evcc = EvccClient(evcc_url=EVCC_URL, loadpoint_id=EVCC_LOADPOINT_ID) if EVCC_URL else None
-
-if MODEL_PUBLISHER in MODEL_PUBLISHER_FACTORIES:
-    publisher = MODEL_PUBLISHER_FACTORIES[MODEL_PUBLISHER]()
-else:
-    logging.warning("Unknown publisher: %s", MODEL_PUBLISHER)
-    publisher = ModelPublisher()
-
-car = CarspecificSettings(soc_percent_correction=SOC_PERCENT_CORRECTION, soc_almost_full_limit=SOC_ALMOST_FULL_LIMIT)
-
-main_loop(car=car, world=world, evcc=evcc, publisher=publisher, elm327_host=WICAN_IP, elm327_port=WICAN_ELM327_PORT)
+world = WorldView(sleep_voltage=config.obd2_sleep_voltage)
+memory = MemoryReporter(trace_frames=config.memory_trace_frames)
+state_publishers = []
+if config.http_api_port:
+    store = StateStore()
+    HttpStateServer(store, host=config.http_api_bind, port=config.http_api_port).start()
+    state_publishers.append(HttpStatePublisher(store))
+runtime = Runtime(config, reloader=reloader, memory=memory, state_publishers=state_publishers)
+reloader.install_signal_handler()
+memory.install_signal_handler()
+
+latency = LatencyModel(path=config.elm327_latency_model_file or None)
+latency.load()
+health = ConnectionHealthSettings(heartbeat_interval=config.elm327_heartbeat_interval,
+                                  heartbeat_timeout=config.elm327_heartbeat_timeout)
+
+main_loop(runtime=runtime, world=world, elm327_host=config.elm327_host, elm327_port=config.elm327_port,
+          latency=latency, health=health)